@@ -76,13 +76,42 @@ AUTH_USER_MODEL = "base.BaseUser"
 
 # Database
 
+# The connections are kept open by every request thread for that many seconds,
+# so that only the first request of a thread pays for the connection setup.
+CONN_MAX_AGE = env.int("CONN_MAX_AGE_SECONDS", 60)
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# The users are hash-partitioned by email address across these database
+# aliases. The default database must come first, it keeps the users created
+# before sharding. Aliases missing from DATABASES get their own sqlite file.
+USER_SHARDS = env.list("USER_SHARDS", default=["default"])
+
+for alias in USER_SHARDS:
+    DATABASES.setdefault(
+        alias,
+        {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "{alias}.sqlite3".format(alias=alias),
+            "CONN_MAX_AGE": CONN_MAX_AGE,
+            "CONN_HEALTH_CHECKS": True,
+        },
+    )
+
+DATABASE_ROUTERS = ["base.routers.UserShardRouter"]
+
+TEST_RUNNER = "base.test_runner.TestRunner"
+
+# Cache shared by the workers, e.g. "redis://127.0.0.1:6379/1" in production.
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
 
 # Password validation
 
@@ -94,13 +123,18 @@ AUTH_PASSWORD_VALIDATORS = [
         "NAME": "django.contrib.auth.password_validation.MinimumLengthValidator",
     },
     {
-        "NAME": "django.contrib.auth.password_validation.CommonPasswordValidator",
+        "NAME": "base.password_validation.BreachedPasswordValidator",
     },
     {
         "NAME": "django.contrib.auth.password_validation.NumericPasswordValidator",
     },
 ]
 
+# Built with `manage.py build_breached_passwords`, see base/password_validation.py.
+BREACHED_PASSWORDS_FILE = env.path(
+    "BREACHED_PASSWORDS_FILE", default=BASE_DIR / "breached_passwords.bin"
+)
+
 
 # Internationalization
 
@@ -121,10 +155,15 @@ STATIC_URL = "static/"
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": ("rest_framework.permissions.IsAuthenticated",),
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "base.authentication.JWTAuthentication",
     ),
     "DEFAULT_TOKEN_OBTAIN_PAIR": "base.serializers.TokenObtainPairWithUserSerializer",
-    "DEFAULT_RENDERER_CLASSES": ("rest_framework.renderers.JSONRenderer",),
+    "DEFAULT_RENDERER_CLASSES": ("base.renderers.FastJSONRenderer",),
+    "DEFAULT_PARSER_CLASSES": (
+        "base.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
 }
 
@@ -152,6 +191,37 @@ ACCESS_TOKEN_LIFETIME = datetime.timedelta(
 REFRESH_TOKEN_LIFETIME = datetime.timedelta(
     weeks=int(env.int("REFRESH_TOKEN_LIFETIME_WEEKS", 1))
 )
+# Responses to requests with an `Idempotency-Key` header are replayed to the
+# retries for that many seconds, see base/idempotency.py.
+IDEMPOTENCY_CACHE = "default"
+IDEMPOTENCY_KEY_TTL = env.int("IDEMPOTENCY_KEY_TTL_SECONDS", 24 * 60 * 60)
+# Shorter for the responses that carry live tokens, like the registration one.
+IDEMPOTENCY_TOKEN_RESPONSE_TTL = env.int(
+    "IDEMPOTENCY_TOKEN_RESPONSE_TTL_SECONDS", 5 * 60
+)
+
+# Tokens verified by `api/auth/verify` are cached per worker for that many
+# seconds, see base/forward_auth.py.
+FORWARD_AUTH_CACHE_SECONDS = env.int("FORWARD_AUTH_CACHE_SECONDS", 5)
+FORWARD_AUTH_CACHE_SIZE = env.int("FORWARD_AUTH_CACHE_SIZE", 10000)
+
+# Authentication events are queued in memory and written in batches, see
+# base/audit.py. `prune_audit_events` deletes the ones past the retention.
+AUDIT_BATCH_SIZE = env.int("AUDIT_BATCH_SIZE", 100)
+AUDIT_FLUSH_INTERVAL = env.int("AUDIT_FLUSH_INTERVAL_SECONDS", 5)
+AUDIT_RETENTION_DAYS = env.int("AUDIT_RETENTION_DAYS", 90)
+
+# Accounts not seen for that many days are moved to the archive table by the
+# `archive_users` command.
+ARCHIVE_USERS_AFTER_DAYS = env.int("ARCHIVE_USERS_AFTER_DAYS", 365)
+
+# `last_login` and `last_seen` are buffered in memory and written in batches at
+# most once per interval, see base/activity.py.
+ACTIVITY_FLUSH_INTERVAL = env.int("ACTIVITY_FLUSH_INTERVAL_SECONDS", 60)
+
+# Requests to reset the password of the same address within that many seconds
+# reuse the email sent for the first one.
+RESET_PASSWORD_COALESCE_WINDOW = env.int("RESET_PASSWORD_COALESCE_WINDOW_SECONDS", 60)
 RESET_PASSWORD_TOKEN_MAX_AGE = datetime.timedelta(
     days=int(env.int("RESET_PASSWORD_TOKEN_MAX_AGE", 3))
 ).seconds
@@ -184,6 +254,7 @@ EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_USE_TLS = True
 EMAIL_PORT = 587
+EMAIL_TIMEOUT = env.int("EMAIL_TIMEOUT_SECONDS", 10)
 EMAIL_HOST_USER = env.str("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = env.str("EMAIL_HOST_PASSWORD")
 
@@ -191,3 +262,20 @@ EMAIL_HOST_PASSWORD = env.str("EMAIL_HOST_PASSWORD")
 # Default primary key field type
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# The summaries of the admin bulk actions and the audit log errors are written
+# by the `base.audit` logger, see base/admin.py and base/audit.py.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "base.audit": {
+            "handlers": ["console"],
+            "level": env.str("AUDIT_LOG_LEVEL", "INFO"),
+        },
+    },
+}
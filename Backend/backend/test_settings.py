@@ -0,0 +1,25 @@
+"""
+Settings of the test suite, with two extra user shards so that the routing
+across databases is covered:
+
+    python manage.py test --settings=backend.test_settings
+
+The sharded tests are skipped when the suite runs with the default settings.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, DATABASES, env
+
+USER_SHARDS = env.list("USER_SHARDS", default=["default", "shard1", "shard2"])
+
+for alias in USER_SHARDS:
+    DATABASES.setdefault(
+        alias,
+        {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "{alias}.sqlite3".format(alias=alias),
+        },
+    )
+
+# The stock PBKDF2 iterations make the tests slow.
+PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Warm the worker up in the background, `/readyz` reports it as ready once done
+# and while the databases answer.
+from base.warmup import start_warm_up  # noqa: E402
+
+start_warm_up()
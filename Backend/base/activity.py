@@ -0,0 +1,135 @@
+import atexit
+import datetime
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, close_old_connections
+from django.utils.timezone import now
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# The first activity of a user who hasn't been seen for that long is written
+# right away, so that `archive_users` never takes an active user for a dormant
+# one because of a timestamp still in the buffer.
+WRITE_THROUGH_AFTER = datetime.timedelta(days=1)
+
+
+class ActivityBuffer:
+    """
+    Write-behind buffer for the `last_login` and `last_seen` timestamps of the
+    users.
+
+    The timestamps are kept in memory, per worker, and written by a background
+    thread every `ACTIVITY_FLUSH_INTERVAL` seconds with one batched
+    `bulk_update` (an `UPDATE ... SET ... = CASE ...`) per database, so that no
+    request pays for the write. If the worker dies, at most one interval of
+    activity is lost. Only the first activity of a user after
+    `WRITE_THROUGH_AFTER` of absence is written by the request itself.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.worker_pid = None
+        self.enabled = True
+
+    @property
+    def interval(self):
+        return getattr(settings, "ACTIVITY_FLUSH_INTERVAL", 60)
+
+    def record(self, user, login=False):
+        """
+        Records that the user has been seen now, and logged in if `login` is set.
+        """
+
+        if not self.enabled:
+            return
+
+        timestamp = now()
+        key = (user._state.db or "default", user.pk)
+
+        with self.lock:
+            last_login, _ = self.pending.get(key, (None, None))
+            self.pending[key] = (timestamp if login else last_login, timestamp)
+            self._ensure_worker()
+
+        if user.last_seen is None or timestamp - user.last_seen >= WRITE_THROUGH_AFTER:
+            fields = {"last_seen": timestamp}
+            if login:
+                fields["last_login"] = timestamp
+            try:
+                User._base_manager.using(key[0]).filter(pk=user.pk).update(**fields)
+            except DatabaseError:
+                logger.exception("Could not write the activity of user %s.", user.pk)
+
+    def flush(self):
+        """
+        Writes all the buffered timestamps to the database.
+        """
+
+        with self.lock:
+            pending, self.pending = self.pending, {}
+
+        if not pending:
+            return
+
+        logins = defaultdict(list)
+        seen = defaultdict(list)
+        for (db, pk), (last_login, last_seen) in pending.items():
+            if last_login is not None:
+                logins[db].append(
+                    User(pk=pk, last_login=last_login, last_seen=last_seen)
+                )
+            else:
+                seen[db].append(User(pk=pk, last_seen=last_seen))
+
+        try:
+            for db, users in logins.items():
+                User.objects.using(db).bulk_update(
+                    users, ["last_login", "last_seen"], batch_size=500
+                )
+            for db, users in seen.items():
+                User.objects.using(db).bulk_update(
+                    users, ["last_seen"], batch_size=500
+                )
+        except DatabaseError:
+            logger.exception(
+                "Could not flush the activity of %d users.", len(pending)
+            )
+
+    def disable(self):
+        """
+        Drops the buffered timestamps and ignores the next ones, so that nothing
+        is written by the worker or at exit. Used by the test runner.
+        """
+
+        with self.lock:
+            self.enabled = False
+            self.pending = {}
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, every worker process starts its own.
+        if self.worker_pid == os.getpid():
+            return
+
+        self.worker_pid = os.getpid()
+        threading.Thread(
+            target=self._run, name="activity-buffer", daemon=True
+        ).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            close_old_connections()
+            self.flush()
+
+
+activity_buffer = ActivityBuffer()
+atexit.register(activity_buffer.flush)
@@ -1,13 +1,137 @@
-from django.contrib import admin
+import heapq
+import logging
+
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
 from django.contrib.auth import get_user_model
+from django.contrib.admin.views.main import PAGE_VAR, ChangeList
+from django.utils.timezone import now
 from .forms import UserChangeForm, UserCreationForm
+from .paginators import EstimatedCountPaginator
+from .sharding import is_sharded
+from .signals import users_auth_changed
 
 admin.site.unregister(Group)
 
 User = get_user_model()
 
+audit_logger = logging.getLogger("base.audit")
+
+KEYSET_VAR = "after"
+
+
+class KeysetChangeList(ChangeList):
+    """
+    A changelist that pages with `WHERE emailAddress > <last email>` instead of
+    an `OFFSET` when the list is ordered by email address, so that the deep
+    pages are as cheap as the first one.
+    """
+
+    keyset_field = "emailAddress"
+    is_fan_out = False
+
+    def __init__(self, request, *args, **kwargs):
+        self.keyset_after = request.GET.get(KEYSET_VAR)
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    @property
+    def keyset_lookup(self):
+        # The email address is unique, anything ordered after it is irrelevant.
+        ordering = self.queryset.query.order_by
+        if not ordering:
+            return None
+        if ordering[0] == self.keyset_field:
+            return self.keyset_field + "__gt"
+        if ordering[0] == "-" + self.keyset_field:
+            return self.keyset_field + "__lt"
+        return None
+
+    def get_results(self, request):
+        # The cursor must not leak into the sorting and filtering links.
+        self.params.pop(KEYSET_VAR, None)
+        getattr(self, "filter_params", {}).pop(KEYSET_VAR, None)
+
+        querysets = self.queryset.per_shard()
+        self.is_fan_out = len(querysets) > 1
+        if self.is_fan_out:
+            self.get_fan_out_results(request, querysets)
+            return
+
+        super().get_results(request)
+
+        lookup = self.keyset_lookup
+        if self.keyset_after is not None and lookup is not None:
+            self.result_list = self.queryset.filter(**{lookup: self.keyset_after})[
+                : self.list_per_page
+            ]
+            self.multi_page = True
+
+    def get_fan_out_results(self, request, querysets):
+        """
+        Lists the users of every shard: takes a page from each one of them,
+        starting after the keyset cursor, and merges them in order. Offset pages
+        are not available in that case, only the keyset ones.
+        """
+
+        paginators = [
+            self.model_admin.get_paginator(request, queryset, self.list_per_page)
+            for queryset in querysets
+        ]
+
+        ordering = self.queryset.query.order_by
+        field = ordering[0] if ordering and isinstance(ordering[0], str) else "pk"
+        descending = field.startswith("-")
+        field = field.lstrip("-")
+
+        lookup = self.keyset_lookup
+        if self.keyset_after is not None and lookup is not None:
+            querysets = [
+                queryset.filter(**{lookup: self.keyset_after})
+                for queryset in querysets
+            ]
+
+        def sort_key(user):
+            value = getattr(user, field)
+            return value is None, value
+
+        merged = heapq.merge(
+            *(queryset[: self.list_per_page] for queryset in querysets),
+            key=sort_key,
+            reverse=descending,
+        )
+
+        self.paginator = paginators[0]
+        self.result_count = sum(paginator.count for paginator in paginators)
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = list(merged)[: self.list_per_page]
+        self.can_show_all = False
+        self.multi_page = self.result_count > self.list_per_page
+
+    def get_next_keyset_url(self):
+        """
+        :return: The query string of the page following the current one, or None
+            if this is the last page or keyset pagination can't be used.
+        :rtype: str | None
+        """
+
+        if self.keyset_lookup is None or self.show_all:
+            return None
+
+        results = list(self.result_list)
+        if len(results) < self.list_per_page:
+            return None
+
+        last = getattr(results[-1], self.keyset_field)
+        return self.get_query_string({KEYSET_VAR: last}, [PAGE_VAR])
+
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -32,6 +156,79 @@ class UserAdmin(BaseUserAdmin):
         ),
     )
 
-    search_fields = ("emailAddress",)
+    # Prefix searches can use the indexes of the email and name columns, a
+    # plain `icontains` always scans the whole table.
+    search_fields = ("^emailAddress", "^firstName", "^lastName")
     ordering = ("emailAddress",)
     filter_horizontal = ()
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    actions = [
+        "deactivate_users",
+        "reactivate_users",
+        "grant_admin",
+        "revoke_admin",
+        "force_logout",
+    ]
+    bulk_update_chunk_size = 1000
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # The stock deletion collects the related objects on a single
+        # database, it can't delete across shards.
+        if is_sharded():
+            actions.pop("delete_selected", None)
+        return actions
+
+    def bulk_update(self, request, queryset, action, **values):
+        """
+        Applies the values to every user matched by the queryset with chunked
+        `UPDATE` statements, so that it also works when all the users across
+        pages are selected. Emits a single audit entry for the whole action.
+        """
+
+        updated = 0
+        for shard_queryset in queryset.per_shard():
+            for user_ids in shard_queryset.update_in_chunks(
+                chunk_size=self.bulk_update_chunk_size, **values
+            ):
+                users_auth_changed.send(sender=self.model, user_ids=user_ids)
+                updated += len(user_ids)
+
+        audit_logger.info(
+            "Admin action %s by %s updated %d users.", action, request.user, updated
+        )
+        self.message_user(
+            request,
+            "{action}: {count} user(s) updated.".format(action=action, count=updated),
+            messages.SUCCESS,
+        )
+
+    @admin.action(description="Deactivate selected users")
+    def deactivate_users(self, request, queryset):
+        queryset = queryset.filter(is_active=True).exclude(pk=request.user.pk)
+        self.bulk_update(request, queryset, "deactivate_users", is_active=False)
+
+    @admin.action(description="Reactivate selected users")
+    def reactivate_users(self, request, queryset):
+        queryset = queryset.filter(is_active=False)
+        self.bulk_update(request, queryset, "reactivate_users", is_active=True)
+
+    @admin.action(description="Grant admin to selected users")
+    def grant_admin(self, request, queryset):
+        queryset = queryset.filter(is_admin=False)
+        self.bulk_update(request, queryset, "grant_admin", is_admin=True)
+
+    @admin.action(description="Revoke admin from selected users")
+    def revoke_admin(self, request, queryset):
+        queryset = queryset.filter(is_admin=True).exclude(pk=request.user.pk)
+        self.bulk_update(request, queryset, "revoke_admin", is_admin=False)
+
+    @admin.action(description="Log out selected users from all devices")
+    def force_logout(self, request, queryset):
+        self.bulk_update(request, queryset, "force_logout", tokens_valid_after=now())
@@ -0,0 +1,109 @@
+from django.contrib.auth import get_user_model
+from django.db import connections, transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+
+from .activity import activity_buffer
+from .models import ARCHIVED_USER_FIELDS, ArchivedUser
+
+User = get_user_model()
+
+
+def get_dormant_users(cutoff, include_never_seen=False):
+    """
+    The activity buffered by the other processes is at most
+    `ACTIVITY_FLUSH_INTERVAL` old, and only for users seen recently: the first
+    activity after a long absence is written right away by the activity buffer.
+
+    :param cutoff: The users whose last activity is older are dormant.
+    :param include_never_seen: Also include the users that have never been
+        seen, whose age is unknown.
+    :return: The dormant users, admins excluded.
+    :rtype: UserQuerySet
+    """
+
+    activity_buffer.flush()
+
+    dormant = Q(last_activity__lt=cutoff)
+    if include_never_seen:
+        dormant |= Q(last_activity__isnull=True)
+
+    return (
+        User.objects.filter(is_admin=False)
+        .alias(last_activity=Coalesce("last_seen", "last_login"))
+        .filter(dormant)
+    )
+
+
+def archive_users(queryset, chunk_size=1000):
+    """
+    Moves the users of the queryset to the archive table, shard after shard and
+    one chunk of primary keys at a time. Each chunk is first copied to the
+    archive, then deleted from the user table if the users are still matched by
+    the queryset, so that a user who logs in meanwhile isn't archived.
+
+    :return: Yields the number of users archived by every chunk, the caller
+        must exhaust the generator for all the users to be archived.
+    :rtype: generator(int)
+    """
+
+    for shard_queryset in queryset.per_shard():
+        shard_queryset = shard_queryset.order_by("pk")
+        last_pk = None
+
+        while True:
+            chunk = shard_queryset
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            rows = list(chunk.values(*ARCHIVED_USER_FIELDS)[:chunk_size])
+            if not rows:
+                break
+
+            last_pk = rows[-1]["id"]
+            pks = [row["id"] for row in rows]
+
+            with transaction.atomic(using=ArchivedUser.objects.db):
+                ArchivedUser.objects.filter(pk__in=pks).delete()
+                ArchivedUser.objects.bulk_create(
+                    [ArchivedUser(**row) for row in rows]
+                )
+
+            with transaction.atomic(using=shard_queryset.db):
+                archived = list(
+                    shard_queryset.filter(pk__in=pks)
+                    .select_for_update()
+                    .values_list("pk", flat=True)
+                )
+                delete_users(shard_queryset.db, archived)
+
+            skipped = set(pks).difference(archived)
+            if skipped:
+                ArchivedUser.objects.filter(pk__in=skipped).delete()
+
+            yield len(archived)
+
+
+def delete_users(db, pks):
+    """
+    Deletes the users with the given primary keys from a shard. The extra shards
+    only hold the user table, the collector of `QuerySet.delete()` would look
+    for the related rows there, so the users are deleted with plain SQL.
+    """
+
+    if db == "default":
+        User._base_manager.using(db).filter(pk__in=pks).delete()
+        return
+
+    if not pks:
+        return
+
+    connection = connections[db]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM {table} WHERE {pk} IN ({params})".format(
+                table=connection.ops.quote_name(User._meta.db_table),
+                pk=connection.ops.quote_name(User._meta.pk.column),
+                params=", ".join(["%s"] * len(pks)),
+            ),
+            pks,
+        )
@@ -0,0 +1,111 @@
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+
+from .models import AuthEvent
+
+logger = logging.getLogger(__name__)
+
+
+def get_client_ip(request):
+    if request is None:
+        return None
+    return request.META.get("REMOTE_ADDR") or None
+
+
+class AuditLog:
+    """
+    In-process queue of authentication events.
+
+    Recording an event only appends it to a list, the events are written by a
+    background thread with one `bulk_create` once `AUDIT_BATCH_SIZE` events are
+    queued or every `AUDIT_FLUSH_INTERVAL` seconds, whichever comes first. If
+    the worker dies, the queued events are lost.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = []
+        self.wake_up = threading.Event()
+        self.worker_pid = None
+        self.enabled = True
+
+    @property
+    def batch_size(self):
+        return getattr(settings, "AUDIT_BATCH_SIZE", 100)
+
+    @property
+    def interval(self):
+        return getattr(settings, "AUDIT_FLUSH_INTERVAL", 5)
+
+    def record(self, event, user=None, email="", request=None):
+        """
+        Queues an event, `email` defaults to the email address of the user.
+        """
+
+        if not self.enabled:
+            return
+
+        entry = AuthEvent(
+            event=event,
+            user_id=user.pk if user is not None else None,
+            emailAddress=(email or getattr(user, "emailAddress", ""))[:255],
+            ip_address=get_client_ip(request),
+        )
+
+        with self.lock:
+            self.pending.append(entry)
+            full = len(self.pending) >= self.batch_size
+            self._ensure_worker()
+
+        if full:
+            self.wake_up.set()
+
+    def flush(self):
+        """
+        Writes all the queued events to the database.
+        """
+
+        with self.lock:
+            pending, self.pending = self.pending, []
+
+        if not pending:
+            return
+
+        try:
+            AuthEvent.objects.bulk_create(pending, batch_size=500)
+        except DatabaseError:
+            logger.exception("Could not write %d audit events.", len(pending))
+
+    def disable(self):
+        """
+        Drops the queued events and ignores the next ones, so that nothing is
+        written by the worker or at exit. Used by the test runner.
+        """
+
+        with self.lock:
+            self.enabled = False
+            self.pending = []
+
+    def _ensure_worker(self):
+        # Threads don't survive a fork, every worker process starts its own.
+        if self.worker_pid == os.getpid():
+            return
+
+        self.worker_pid = os.getpid()
+        threading.Thread(target=self._run, name="audit-log", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.wake_up.wait(self.interval)
+            self.wake_up.clear()
+            close_old_connections()
+            self.flush()
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.flush)
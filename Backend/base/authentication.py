@@ -0,0 +1,41 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import authentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+
+from .activity import activity_buffer
+
+
+def is_token_revoked(tokens_valid_after, token):
+    """
+    Checks if the token was issued before the moment from which the tokens of
+    the user are valid, i.e. before the user was force-logged out.
+
+    :rtype: bool
+    """
+
+    if tokens_valid_after is None:
+        return False
+
+    # `iat` is in whole seconds, a token issued in the same second right after
+    # the force logout must stay valid.
+    issued_at = token.get("iat")
+    valid_after = tokens_valid_after.replace(microsecond=0).timestamp()
+    return issued_at is None or issued_at < valid_after
+
+
+class JWTAuthentication(authentication.JWTAuthentication):
+    """
+    The simplejwt authentication that also rejects the tokens that were issued
+    before the user was force-logged out.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+
+        if is_token_revoked(user.tokens_valid_after, validated_token):
+            raise AuthenticationFailed(
+                _("Token has been revoked"), code="token_revoked"
+            )
+
+        activity_buffer.record(user)
+        return user
@@ -0,0 +1,172 @@
+import csv
+import io
+import itertools
+import zlib
+
+from django.contrib.auth import get_user_model
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date, parse_datetime
+
+User = get_user_model()
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+# The password hash is never exported.
+EXPORT_FIELDS = (
+    "id",
+    "emailAddress",
+    "firstName",
+    "lastName",
+    "is_active",
+    "is_admin",
+    "last_login",
+    "last_seen",
+)
+
+BOOLEAN_VALUES = {"true": True, "1": True, "false": False, "0": False}
+
+
+def _parse_datetime(value):
+    parsed = parse_datetime(value) or parse_date(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+
+# Filter name -> parser of the raw value.
+EXPORT_FILTERS = {
+    "is_active": lambda value: BOOLEAN_VALUES[value.lower()],
+    "is_admin": lambda value: BOOLEAN_VALUES[value.lower()],
+    "emailAddress__istartswith": str,
+    "last_login__gte": _parse_datetime,
+    "last_login__lt": _parse_datetime,
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_export_fields(fields):
+    """
+    :param fields: A comma separated list of fields, all exportable fields are
+        used if empty.
+    :rtype: list
+    """
+
+    if not fields:
+        return list(EXPORT_FIELDS)
+
+    fields = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in fields if field not in EXPORT_FIELDS]
+    if unknown:
+        raise ExportError(
+            "Unknown fields: {unknown}. Available fields are: {available}.".format(
+                unknown=", ".join(unknown), available=", ".join(EXPORT_FIELDS)
+            )
+        )
+    return fields
+
+
+def parse_export_filters(filters):
+    """
+    :param filters: Mapping of filter name to raw string value, the names that
+        are not export filters are ignored.
+    :rtype: dict
+    """
+
+    lookups = {}
+    for name, parse in EXPORT_FILTERS.items():
+        if name not in filters:
+            continue
+        try:
+            lookups[name] = parse(filters[name])
+        except (KeyError, ValueError):
+            raise ExportError(
+                "Invalid value '{value}' for filter '{name}'.".format(
+                    value=filters[name], name=name
+                )
+            )
+    return lookups
+
+
+def iter_export(fields, filters, export_format="csv", compress=False, chunk_size=None):
+    """
+    Streams the users matching the filters as CSV or JSON lines. Rows are read
+    shard after shard with `.values().iterator()`, which uses a server-side
+    cursor where the database supports it, so memory use doesn't depend on the
+    number of users.
+
+    :return: A generator of bytes, gzip compressed if `compress` is set.
+    :rtype: generator(bytes)
+    """
+
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(
+            "Unknown format '{format}'. Available formats are: {available}.".format(
+                format=export_format, available=", ".join(EXPORT_FORMATS)
+            )
+        )
+
+    rows = itertools.chain.from_iterable(
+        queryset.order_by("pk")
+        .values(*fields)
+        .iterator(chunk_size=chunk_size or DEFAULT_CHUNK_SIZE)
+        for queryset in User.objects.filter(**filters).per_shard()
+    )
+
+    if export_format == "csv":
+        lines = _iter_csv(fields, rows)
+    else:
+        lines = _iter_jsonl(rows)
+
+    if compress:
+        return _iter_gzip(lines)
+    return lines
+
+
+def _iter_csv(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        # Yield chunks of ~64KB rather than one per row.
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
+
+
+def _iter_jsonl(rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    chunk = []
+    size = 0
+
+    for row in rows:
+        line = encoder.encode(row) + "\n"
+        chunk.append(line)
+        size += len(line)
+        if size >= 64 * 1024:
+            yield "".join(chunk).encode()
+            chunk = []
+            size = 0
+
+    yield "".join(chunk).encode()
+
+
+def _iter_gzip(chunks):
+    # `wbits=31` writes a gzip header and trailer around the deflate stream.
+    compressor = zlib.compressobj(wbits=31)
+
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+
+    yield compressor.flush()
@@ -3,6 +3,8 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
 from django.core.exceptions import ValidationError
 
+from .models import ArchivedUser
+
 
 class UserCreationForm(forms.ModelForm):
     password1 = forms.CharField(label="Password", widget=forms.PasswordInput)
@@ -15,6 +17,13 @@ class UserCreationForm(forms.ModelForm):
 
         fields = ["emailAddress", "firstName"]
 
+    def clean_emailAddress(self):
+        email = self.cleaned_data.get("emailAddress")
+        # The unique validation of the form only covers the user table.
+        if email and ArchivedUser.objects.filter(emailAddress=email).exists():
+            raise ValidationError("An archived user already has this email address.")
+        return email
+
     def clean_password2(self):
         password1 = self.cleaned_data.get("password1")
         password2 = self.cleaned_data.get("password2")
@@ -0,0 +1,150 @@
+import threading
+import time
+
+from django.conf import settings
+from django.dispatch import receiver
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+
+from .authentication import JWTAuthentication
+from .signals import users_auth_changed
+
+
+class VerifiedTokenCache:
+    """
+    Per worker micro-cache of the tokens verified by the forward-auth endpoint.
+
+    A token is kept for at most `FORWARD_AUTH_CACHE_SECONDS`, and never past its
+    own expiry, so a burst of subrequests carrying the same token costs one
+    signature check and one user lookup. Tokens of users whose authentication
+    state changed in bulk are dropped right away in the worker that made the
+    change; the other workers see it once the entries expire.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.tokens_by_user = {}
+
+    @property
+    def ttl(self):
+        return getattr(settings, "FORWARD_AUTH_CACHE_SECONDS", 5)
+
+    @property
+    def max_size(self):
+        return getattr(settings, "FORWARD_AUTH_CACHE_SIZE", 10000)
+
+    def get(self, raw_token):
+        """
+        :return: The user id and email address of the token, or None if the
+            token isn't cached.
+        :rtype: tuple(str, str) | None
+        """
+
+        entry = self.entries.get(raw_token)
+        if entry is None:
+            return None
+
+        expires_at, user_id, email = entry
+        if expires_at <= time.time():
+            self.discard(raw_token)
+            return None
+        return user_id, email
+
+    def set(self, raw_token, validated_token, user):
+        expires_at = time.time() + self.ttl
+        if "exp" in validated_token:
+            expires_at = min(expires_at, validated_token["exp"])
+
+        user_id = str(user.pk)
+        with self.lock:
+            if len(self.entries) >= self.max_size:
+                self._evict()
+            self.entries[raw_token] = (expires_at, user_id, user.emailAddress)
+            self.tokens_by_user.setdefault(user_id, set()).add(raw_token)
+
+    def discard(self, raw_token):
+        with self.lock:
+            entry = self.entries.pop(raw_token, None)
+            if entry is not None:
+                self._unlink(entry[1], raw_token)
+
+    def discard_users(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                for raw_token in self.tokens_by_user.pop(str(user_id), ()):
+                    self.entries.pop(raw_token, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.tokens_by_user.clear()
+
+    def _unlink(self, user_id, raw_token):
+        tokens = self.tokens_by_user.get(user_id)
+        if tokens is not None:
+            tokens.discard(raw_token)
+            if not tokens:
+                del self.tokens_by_user[user_id]
+
+    def _evict(self):
+        # Drop the expired entries, or everything if the cache is full of live
+        # ones, which is cheaper than tracking the least recently used.
+        timestamp = time.time()
+        expired = [
+            (raw_token, user_id)
+            for raw_token, (expires_at, user_id, _) in self.entries.items()
+            if expires_at <= timestamp
+        ]
+        if len(expired) < self.max_size // 10:
+            self.entries.clear()
+            self.tokens_by_user.clear()
+            return
+
+        for raw_token, user_id in expired:
+            del self.entries[raw_token]
+            self._unlink(user_id, raw_token)
+
+
+verified_token_cache = VerifiedTokenCache()
+
+
+@receiver(users_auth_changed)
+def drop_cached_tokens(sender, user_ids, **kwargs):
+    verified_token_cache.discard_users(user_ids)
+
+
+_authentication = JWTAuthentication()
+
+
+def verify_request(request):
+    """
+    Authenticates the bearer token of the request.
+
+    :return: The user id and email address of the token owner, or None if the
+        token is missing, invalid, expired or revoked.
+    :rtype: tuple(str, str) | None
+    """
+
+    header = _authentication.get_header(request)
+    if header is None:
+        return None
+
+    try:
+        raw_token = _authentication.get_raw_token(header)
+    except AuthenticationFailed:
+        return None
+    if raw_token is None:
+        return None
+
+    cached = verified_token_cache.get(raw_token)
+    if cached is not None:
+        return cached
+
+    try:
+        validated_token = _authentication.get_validated_token(raw_token)
+        user = _authentication.get_user(validated_token)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+
+    verified_token_cache.set(raw_token, validated_token, user)
+    return str(user.pk), user.emailAddress
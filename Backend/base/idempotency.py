@@ -0,0 +1,113 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotentViewMixin:
+    """
+    Honors the `Idempotency-Key` header on POST requests.
+
+    The first response to a (route, key, body) triple is kept in the
+    `IDEMPOTENCY_CACHE` for `idempotency_key_ttl` seconds, `IDEMPOTENCY_KEY_TTL`
+    by default, and replayed to the retries without running the view again.
+    Concurrent duplicates wait behind a short lock for the first one to finish,
+    the lock is refreshed for as long as the view runs. Server errors are not
+    kept, so they can be retried.
+    """
+
+    idempotent_methods = ("POST",)
+    idempotency_key_ttl = None
+    idempotency_lock_timeout = 10
+    idempotency_poll_interval = 0.05
+
+    def dispatch(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method not in self.idempotent_methods or not key:
+            return super().dispatch(request, *args, **kwargs)
+
+        cache = caches[settings.IDEMPOTENCY_CACHE]
+        cache_key = self.get_idempotency_cache_key(request, key)
+        lock_key = cache_key + ":lock"
+
+        deadline = time.monotonic() + self.idempotency_lock_timeout
+        while True:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return self.replay_response(stored)
+            if cache.add(lock_key, True, timeout=self.idempotency_lock_timeout):
+                break
+            if time.monotonic() >= deadline:
+                return JsonResponse(
+                    {"error": "ERROR_IDEMPOTENCY_KEY_IN_USE"}, status=409
+                )
+            time.sleep(self.idempotency_poll_interval)
+
+        done = threading.Event()
+        threading.Thread(
+            target=self.refresh_lock,
+            args=(cache, lock_key, done),
+            name="idempotency-lock",
+            daemon=True,
+        ).start()
+
+        try:
+            # The lock may have been taken right after the first request stored
+            # its response.
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return self.replay_response(stored)
+
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+
+            if response.status_code < 500 and not response.streaming:
+                cache.set(
+                    cache_key,
+                    {
+                        "status": response.status_code,
+                        "content": response.content,
+                        "content_type": response.get("Content-Type"),
+                    },
+                    timeout=self.get_idempotency_key_ttl(),
+                )
+            return response
+        finally:
+            done.set()
+            cache.delete(lock_key)
+
+    def get_idempotency_key_ttl(self):
+        if self.idempotency_key_ttl is not None:
+            return self.idempotency_key_ttl
+        return settings.IDEMPOTENCY_KEY_TTL
+
+    def refresh_lock(self, cache, lock_key, done):
+        # A slow view, e.g. one sending an email, must not lose the lock to a
+        # duplicate that would run it a second time.
+        while not done.wait(self.idempotency_lock_timeout / 2):
+            cache.touch(lock_key, timeout=self.idempotency_lock_timeout)
+
+    @staticmethod
+    def get_idempotency_cache_key(request, key):
+        body_hash = hashlib.sha256(request.body).hexdigest()
+        digest = hashlib.sha256(
+            "\n".join((request.path, key, body_hash)).encode()
+        ).hexdigest()
+        return "idempotency:" + digest
+
+    @staticmethod
+    def replay_response(stored):
+        response = HttpResponse(
+            stored["content"],
+            status=stored["status"],
+            content_type=stored["content_type"],
+        )
+        response[REPLAYED_HEADER] = "true"
+        return response
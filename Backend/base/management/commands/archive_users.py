@@ -0,0 +1,54 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from base.archive import archive_users, get_dormant_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves the accounts that haven't been seen for a while to the archive "
+        "table. They are restored when they are used to log in or to reset the "
+        "password."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.ARCHIVE_USERS_AFTER_DAYS,
+            help="Days of inactivity, defaults to ARCHIVE_USERS_AFTER_DAYS.",
+        )
+        parser.add_argument(
+            "--include-never-seen",
+            action="store_true",
+            help="Also archive the users that have never logged in.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only count the users that would be archived.",
+        )
+
+    def handle(self, *args, **options):
+        if options["days"] < 1 or options["chunk_size"] < 1:
+            raise CommandError("--days and --chunk-size must be positive.")
+
+        cutoff = now() - datetime.timedelta(days=options["days"])
+        queryset = get_dormant_users(cutoff, options["include_never_seen"])
+
+        if options["dry_run"]:
+            count = sum(shard.count() for shard in queryset.per_shard())
+            self.stdout.write("{count} users would be archived.".format(count=count))
+            return
+
+        archived = 0
+        for count in archive_users(queryset, chunk_size=options["chunk_size"]):
+            archived += count
+            if options["verbosity"] > 1:
+                self.stdout.write("Archived {count} users.".format(count=archived))
+
+        self.stdout.write("Archived {count} users.".format(count=archived))
@@ -0,0 +1,51 @@
+import itertools
+
+from django.conf import settings
+from django.contrib.auth.password_validation import CommonPasswordValidator
+from django.core.management.base import BaseCommand
+
+from base.password_validation import build_breached_password_file, read_corpus
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the memory-mapped breached password file used by the "
+        "BreachedPasswordValidator from local corpus files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "corpus",
+            nargs="*",
+            help="Corpus files, plain text or gzipped, with one entry per line. "
+            "Defaults to the common password list shipped with Django.",
+        )
+        parser.add_argument(
+            "--sha1",
+            action="store_true",
+            help="The entries are SHA-1 hex digests (e.g. Have I Been Pwned) "
+            "instead of passwords.",
+        )
+        parser.add_argument(
+            "--output",
+            "-o",
+            default=str(settings.BREACHED_PASSWORDS_FILE),
+            help="The file to write, defaults to BREACHED_PASSWORDS_FILE.",
+        )
+
+    def handle(self, *args, **options):
+        corpus = options["corpus"] or [
+            str(CommonPasswordValidator().DEFAULT_PASSWORD_LIST_PATH)
+        ]
+        digests = itertools.chain.from_iterable(
+            read_corpus(path, sha1=options["sha1"]) for path in corpus
+        )
+
+        count = build_breached_password_file(digests, options["output"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Wrote {count} passwords to {output}.".format(
+                    count=count, output=options["output"]
+                )
+            )
+        )
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.exports import (
+    DEFAULT_CHUNK_SIZE,
+    EXPORT_FIELDS,
+    EXPORT_FILTERS,
+    EXPORT_FORMATS,
+    ExportError,
+    iter_export,
+    parse_export_fields,
+    parse_export_filters,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the users as CSV or JSON lines, streamed from the database so "
+        "that memory use stays constant."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format", choices=EXPORT_FORMATS, default="csv", dest="export_format"
+        )
+        parser.add_argument(
+            "--fields",
+            help="Comma separated list of fields, out of: {fields}.".format(
+                fields=", ".join(EXPORT_FIELDS)
+            ),
+        )
+        parser.add_argument(
+            "--filter",
+            action="append",
+            default=[],
+            dest="filters",
+            metavar="NAME=VALUE",
+            help="Filter the users, out of: {filters}. Can be repeated.".format(
+                filters=", ".join(EXPORT_FILTERS)
+            ),
+        )
+        parser.add_argument("--gzip", action="store_true", help="Gzip the output.")
+        parser.add_argument(
+            "--output", "-o", help="The file to write to, defaults to stdout."
+        )
+        parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        filters = {}
+        for item in options["filters"]:
+            name, separator, value = item.partition("=")
+            if not separator or name not in EXPORT_FILTERS:
+                raise CommandError("Invalid filter '{item}'.".format(item=item))
+            filters[name] = value
+
+        try:
+            chunks = iter_export(
+                parse_export_fields(options["fields"]),
+                parse_export_filters(filters),
+                options["export_format"],
+                compress=options["gzip"],
+                chunk_size=options["chunk_size"],
+            )
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        if options["output"]:
+            with open(options["output"], "wb") as output:
+                for chunk in chunks:
+                    output.write(chunk)
+        else:
+            # The binary stream under `self.stdout`, the output may be gzipped.
+            output = getattr(self.stdout, "buffer", None)
+            if output is None:
+                raise CommandError("The output isn't a binary stream, use --output.")
+            self.stdout.flush()
+            for chunk in chunks:
+                output.write(chunk)
+            output.flush()
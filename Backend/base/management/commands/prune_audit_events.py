@@ -0,0 +1,58 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from base.models import AuthEvent
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the authentication events older than the retention, one day "
+        "at a time and in chunks, so that no statement locks the table for long."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.AUDIT_RETENTION_DAYS,
+            help="Retention in days, defaults to AUDIT_RETENTION_DAYS.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["days"] < 0 or options["chunk_size"] < 1:
+            raise CommandError("--days and --chunk-size must be positive.")
+
+        cutoff = now() - datetime.timedelta(days=options["days"])
+        oldest = (
+            AuthEvent.objects.order_by("created_at")
+            .values_list("created_at", flat=True)
+            .first()
+        )
+
+        deleted = 0
+        start = oldest
+        while start is not None and start < cutoff:
+            end = min(start + datetime.timedelta(days=1), cutoff)
+            deleted += self.delete_range(start, end, options["chunk_size"])
+            start = end
+
+        self.stdout.write(
+            "Deleted {count} events older than {cutoff}.".format(
+                count=deleted, cutoff=cutoff.isoformat()
+            )
+        )
+
+    @staticmethod
+    def delete_range(start, end, chunk_size):
+        events = AuthEvent.objects.filter(created_at__gte=start, created_at__lt=end)
+        deleted = 0
+
+        while True:
+            pks = list(events.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                return deleted
+            deleted += AuthEvent.objects.filter(pk__in=pks).delete()[0]
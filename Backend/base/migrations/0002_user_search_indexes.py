@@ -0,0 +1,75 @@
+from django.db import migrations
+
+
+# The admin searches the users with `istartswith`, which the plain B-tree
+# indexes can't serve, so the indexes are built on the expression the lookup
+# compiles to on every database.
+SEARCH_INDEXES = (
+    ("base_user_email_search_idx", "emailAddress"),
+    ("base_user_first_name_search_idx", "firstName"),
+    ("base_user_last_name_search_idx", "lastName"),
+)
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    quote_name = schema_editor.quote_name
+    table = quote_name(apps.get_model("base", "BaseUser")._meta.db_table)
+
+    if connection.vendor == "postgresql":
+        # `UPPER(col::text) LIKE ...`, served by a trigram index. Built
+        # concurrently, so that writes to the table aren't blocked meanwhile.
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        sql = (
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} "
+            "USING gin (UPPER({column}::text) gin_trgm_ops)"
+        )
+    elif connection.vendor == "sqlite":
+        # A case-insensitive `LIKE`, which can only use a NOCASE index.
+        sql = "CREATE INDEX IF NOT EXISTS {name} ON {table} ({column} COLLATE NOCASE)"
+    elif connection.vendor == "mysql":
+        # A `LIKE` in the case-insensitive collation of the column, built online.
+        sql = "CREATE INDEX {name} ON {table} ({column}) ALGORITHM=INPLACE LOCK=NONE"
+    else:
+        return
+
+    for name, column in SEARCH_INDEXES:
+        schema_editor.execute(
+            sql.format(name=quote_name(name), table=table, column=quote_name(column))
+        )
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    quote_name = schema_editor.quote_name
+    table = quote_name(apps.get_model("base", "BaseUser")._meta.db_table)
+
+    if connection.vendor == "postgresql":
+        sql = "DROP INDEX CONCURRENTLY IF EXISTS {name}"
+    elif connection.vendor == "sqlite":
+        sql = "DROP INDEX IF EXISTS {name}"
+    elif connection.vendor == "mysql":
+        sql = "DROP INDEX {name} ON {table}"
+    else:
+        return
+
+    for name, column in SEARCH_INDEXES:
+        schema_editor.execute(sql.format(name=quote_name(name), table=table))
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY can't run in a transaction.
+    atomic = False
+
+    dependencies = [
+        ('base', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_search_indexes,
+            drop_search_indexes,
+            hints={"model_name": "baseuser"},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseuser',
+            name='tokens_valid_after',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+from base.sharding import get_user_shards, shard_id_offset
+
+
+def set_shard_id_range(apps, schema_editor):
+    # Start the ids of every shard at the beginning of its own range, so that
+    # the shard of a user can be found from its id.
+    connection = schema_editor.connection
+    if connection.alias not in get_user_shards():
+        return
+
+    offset = shard_id_offset(connection.alias)
+    if offset == 0:
+        return
+
+    table = apps.get_model("base", "BaseUser")._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)",
+                    [table, offset],
+                )
+            elif row[0] < offset:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = %s WHERE name = %s",
+                    [offset, table],
+                )
+        elif connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                "GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {table}) + 1), false)".format(
+                    table=connection.ops.quote_name(table)
+                ),
+                [connection.ops.quote_name(table), offset],
+            )
+        elif connection.vendor == "mysql":
+            cursor.execute(
+                "ALTER TABLE {table} AUTO_INCREMENT = {offset}".format(
+                    table=connection.ops.quote_name(table), offset=int(offset)
+                )
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("base", "0003_user_tokens_valid_after"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            set_shard_id_range,
+            migrations.RunPython.noop,
+            hints={"model_name": "baseuser"},
+        ),
+    ]
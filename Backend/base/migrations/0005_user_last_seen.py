@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_user_shard_id_ranges'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseuser',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
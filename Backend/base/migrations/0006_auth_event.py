@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:39
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_user_last_seen'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('login', 'Login'), ('login_failed', 'Login Failed'), ('register', 'Register'), ('password_change', 'Password Change'), ('password_reset_request', 'Password Reset Request'), ('password_reset', 'Password Reset')], max_length=32)),
+                ('user_id', models.BigIntegerField(blank=True, null=True)),
+                ('emailAddress', models.CharField(blank=True, max_length=255)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Authentication event',
+                'indexes': [models.Index(fields=['created_at'], name='base_auth_event_created_idx'), models.Index(fields=['user_id'], name='base_auth_event_user_idx')],
+            },
+        ),
+    ]
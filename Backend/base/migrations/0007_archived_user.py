@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_auth_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedUser',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('emailAddress', models.CharField(max_length=255, unique=True)),
+                ('firstName', models.CharField(max_length=255)),
+                ('lastName', models.CharField(blank=True, max_length=255, null=True)),
+                ('password', models.CharField(max_length=128)),
+                ('is_active', models.BooleanField()),
+                ('is_admin', models.BooleanField()),
+                ('tokens_valid_after', models.DateTimeField(blank=True, null=True)),
+                ('last_login', models.DateTimeField(blank=True, null=True)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Archived user',
+            },
+        ),
+    ]
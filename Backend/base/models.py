@@ -1,9 +1,178 @@
-from django.db import models
+import logging
+
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager
 from django.utils.timezone import now
 
+from .sharding import (
+    ShardRoutingError,
+    email_for_lookups,
+    get_user_shards,
+    is_sharded,
+    legacy_shard_for_email,
+    shard_for_email,
+    shard_for_id,
+    shard_for_lookups,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class UserQuerySet(models.QuerySet):
+    """
+    When the users are sharded, filtering on the email address or the id sends
+    the query straight to the shard of that user. Email lookups also look at
+    the default database, which keeps the users created before the sharding.
+
+    Any other query has to be bound to a shard with `using()`, or run on every
+    shard with `per_shard()`, evaluating it raises a `ShardRoutingError` rather
+    than silently reading the default database only.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._legacy_db = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._legacy_db = self._legacy_db
+        return clone
+
+    @property
+    def db(self):
+        if self._db is None and "instance" not in self._hints and is_sharded():
+            raise ShardRoutingError(
+                "The query on the users doesn't filter on an email address or "
+                "an id, bind it to a shard with using() or run it on every "
+                "shard with per_shard()."
+            )
+        return super().db
+
+    def using(self, alias):
+        clone = super().using(alias)
+        clone._legacy_db = None
+        return clone
+
+    def _filter_or_exclude(self, negate, args, kwargs):
+        clone = super()._filter_or_exclude(negate, args, kwargs)
+        if negate or self._db is not None or not is_sharded():
+            return clone
+
+        shard = shard_for_lookups(kwargs)
+        if shard is None:
+            return clone
+
+        clone = clone.using(shard)
+        email = email_for_lookups(kwargs)
+        if email is not None:
+            clone._legacy_db = legacy_shard_for_email(email)
+        return clone
+
+    def _fetch_all(self):
+        super()._fetch_all()
+        if not self._result_cache and self._legacy_db is not None:
+            self._result_cache = list(self.using(self._legacy_db))
+
+    def exists(self):
+        if super().exists():
+            return True
+        return self._legacy_db is not None and self.using(self._legacy_db).exists()
+
+    def count(self):
+        if self._legacy_db is None or self._result_cache is not None:
+            return super().count()
+        return super().count() + self.using(self._legacy_db).count()
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if self._legacy_db is not None:
+            rows += self.using(self._legacy_db).update(**kwargs)
+        return rows
+
+    update.alters_data = True
+
+    def delete(self):
+        deleted, rows = super().delete()
+        if self._legacy_db is not None:
+            legacy_deleted, legacy_rows = self.using(self._legacy_db).delete()
+            deleted += legacy_deleted
+            for label, count in legacy_rows.items():
+                rows[label] = rows.get(label, 0) + count
+        return deleted, rows
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def get(self, *args, **kwargs):
+        try:
+            return super().get(*args, **kwargs)
+        except self.model.DoesNotExist:
+            # Dormant accounts are moved out of the user table by the
+            # `archive_users` command, and restored when they are looked up by
+            # id or email address again, e.g. to log in or to refresh a token.
+            lookups = self._get_archive_lookups(args, kwargs)
+            user = ArchivedUser.objects.restore(**lookups) if lookups else None
+            if user is None:
+                raise
+            return user
+
+    def _get_archive_lookups(self, args, kwargs):
+        # Only plain lookups of one user, any other filter could exclude the
+        # archived account.
+        if args or self.query.where or len(kwargs) != 1:
+            return None
+
+        ((lookup, value),) = kwargs.items()
+        field = {"pk": "id", "id": "id", "emailAddress": "emailAddress"}.get(lookup)
+        if field is None or value is None:
+            return None
+        return {field: value}
+
+    def create(self, **kwargs):
+        if self._db is None and is_sharded() and kwargs.get("emailAddress"):
+            return self.using(shard_for_email(kwargs["emailAddress"])).create(**kwargs)
+        return super().create(**kwargs)
+
+    def per_shard(self):
+        """
+        :return: The queryset bound to every shard that can hold its rows, for
+            the queries that have to fan out.
+        :rtype: list
+        """
+
+        if self._legacy_db is not None:
+            return [self.using(self._db), self.using(self._legacy_db)]
+        if self._db is not None or not is_sharded():
+            return [self]
+        return [self.using(shard) for shard in get_user_shards()]
+
+    def update_in_chunks(self, chunk_size=1000, **kwargs):
+        """
+        Updates the rows matched by the queryset with one `UPDATE` statement per
+        chunk of primary keys, without loading model instances.
+
+        :return: Yields the primary keys of every updated chunk, the caller
+            must exhaust the generator for all the rows to be updated.
+        :rtype: generator(list)
+        """
+
+        queryset = self.order_by("pk")
+        last_pk = None
+
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                return
+
+            self.model._base_manager.using(self.db).filter(pk__in=pks).update(
+                **kwargs
+            )
+            last_pk = pks[-1]
+            yield pks
+
 
-class UserManager(BaseUserManager):
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     def create_user(self, emailAddress, firstName, password=None):
         if not emailAddress:
             raise ValueError("You must enter Email Address")
@@ -32,6 +201,8 @@ class BaseUser(AbstractBaseUser):
     lastName = models.CharField(max_length=255, blank=True, null=True)
     is_active = models.BooleanField(default=True)
     is_admin = models.BooleanField(default=False)
+    tokens_valid_after = models.DateTimeField(blank=True, null=True)
+    last_seen = models.DateTimeField(blank=True, null=True)
 
     objects = UserManager()
 
@@ -41,10 +212,39 @@ class BaseUser(AbstractBaseUser):
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "User"
+        # The search indexes are created by the 0002_user_search_indexes
+        # migration, they depend on the database.
 
     def __str__(self) -> str:
         return self.emailAddress
 
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.emailAddress:
+            self.check_email_is_free()
+        super().save(*args, **kwargs)
+
+    def check_email_is_free(self):
+        """
+        The unique index only covers the user table of one database: the address
+        must not be used on the shard it hashes to, nor on the default database
+        by a user created before the sharding, nor by an archived account, which
+        keeps it until it is restored with the same id.
+        """
+
+        existing = [ArchivedUser.objects.filter(emailAddress=self.emailAddress)]
+        if is_sharded():
+            existing.append(BaseUser.objects.filter(emailAddress=self.emailAddress))
+
+        for queryset in existing:
+            if self.pk is not None:
+                queryset = queryset.exclude(pk=self.pk)
+            if queryset.exists():
+                raise IntegrityError(
+                    "A user with the email address {email} already exists.".format(
+                        email=self.emailAddress
+                    )
+                )
+
     @staticmethod
     def has_perm(perm, obj=None):
         return True
@@ -56,3 +256,120 @@ class BaseUser(AbstractBaseUser):
     @property
     def is_staff(self):
         return self.is_admin
+
+
+# The fields of the user that are kept in the archive.
+ARCHIVED_USER_FIELDS = (
+    "id",
+    "emailAddress",
+    "firstName",
+    "lastName",
+    "password",
+    "is_active",
+    "is_admin",
+    "tokens_valid_after",
+    "last_login",
+    "last_seen",
+)
+
+
+class ArchivedUserManager(models.Manager):
+    def restore(self, **lookups):
+        """
+        Moves the archived account matched by the lookups, on the id or the
+        email address, back to the user table.
+
+        :return: The restored user, or None if there is no such archived account.
+        :rtype: BaseUser | None
+        """
+
+        archived = self.filter(**lookups).first()
+        if archived is None:
+            return None
+        return archived.restore()
+
+
+class ArchivedUser(models.Model):
+    """
+    A dormant account moved out of the user table by the `archive_users`
+    command. It keeps the id of the user, the primary key, and is indexed on
+    the email address, which are what the authentication paths look it up with.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    emailAddress = models.CharField(max_length=255, unique=True)
+    firstName = models.CharField(max_length=255)
+    lastName = models.CharField(max_length=255, blank=True, null=True)
+    password = models.CharField(max_length=128)
+    is_active = models.BooleanField()
+    is_admin = models.BooleanField()
+    tokens_valid_after = models.DateTimeField(blank=True, null=True)
+    last_login = models.DateTimeField(blank=True, null=True)
+    last_seen = models.DateTimeField(blank=True, null=True)
+    archived_at = models.DateTimeField(default=now)
+
+    objects = ArchivedUserManager()
+
+    class Meta:
+        verbose_name = "Archived user"
+
+    def __str__(self) -> str:
+        return self.emailAddress
+
+    def restore(self):
+        user = BaseUser(
+            **{field: getattr(self, field) for field in ARCHIVED_USER_FIELDS}
+        )
+        # Seen now, so that the account isn't archived again right away.
+        user.last_seen = now()
+        # The id is kept, so the user goes back to the same shard.
+        shard = shard_for_id(user.pk)
+        try:
+            with transaction.atomic(using=shard):
+                user.save(force_insert=True)
+        except IntegrityError:
+            # Restored by a concurrent request. Read without the archive fallback
+            # of `UserQuerySet.get`, which would come back here.
+            user = BaseUser._base_manager.using(shard).filter(pk=self.pk).first()
+            if user is None:
+                logger.warning(
+                    "Archived user %s can't be restored, its email address is "
+                    "used by another user.",
+                    self.pk,
+                )
+                return None
+
+        self.delete()
+        return user
+
+
+class AuthEvent(models.Model):
+    """
+    An entry of the authentication audit trail, written in batches by
+    `base.audit.audit_log`.
+    """
+
+    class Event(models.TextChoices):
+        LOGIN = "login"
+        LOGIN_FAILED = "login_failed"
+        REGISTER = "register"
+        PASSWORD_CHANGE = "password_change"
+        PASSWORD_RESET_REQUEST = "password_reset_request"
+        PASSWORD_RESET = "password_reset"
+
+    event = models.CharField(max_length=32, choices=Event.choices)
+    # Not a foreign key, the users may live on another database than the events.
+    user_id = models.BigIntegerField(blank=True, null=True)
+    emailAddress = models.CharField(max_length=255, blank=True)
+    ip_address = models.GenericIPAddressField(blank=True, null=True)
+    created_at = models.DateTimeField(default=now)
+
+    class Meta:
+        verbose_name = "Authentication event"
+        indexes = [
+            models.Index(fields=["created_at"], name="base_auth_event_created_idx"),
+            models.Index(fields=["user_id"], name="base_auth_event_user_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return "{event} {email}".format(event=self.event, email=self.emailAddress)
@@ -0,0 +1,74 @@
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+def estimate_table_rows(model, using="default"):
+    """
+    Reads the planner's row estimate for the table of the given model instead of
+    running a `COUNT(*)` over the whole table.
+
+    :return: The estimated number of rows, or None if the database has no
+        estimate available.
+    :rtype: int | None
+    """
+
+    connection = connections[using]
+    table = model._meta.db_table
+
+    if connection.vendor == "postgresql":
+        sql = "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass"
+        params = [connection.ops.quote_name(table)]
+    elif connection.vendor == "mysql":
+        sql = (
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = %s"
+        )
+        params = [table]
+    elif connection.vendor == "sqlite":
+        # Only available once `ANALYZE` has been run on the database.
+        sql = "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1"
+        params = [table]
+    else:
+        return None
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+
+    if row is None or row[0] is None:
+        return None
+
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    A paginator that never counts more than `count_limit` rows.
+
+    Unfiltered lists use the row estimate of the database when there is one.
+    Filtered lists, or databases without an estimate, are counted up to
+    `count_limit` rows, so the count is exact for small result sets and capped
+    for large ones. Pages past the cap can be reached with keyset pagination.
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_table_rows(queryset.model, using=queryset.db)
+            if estimate is not None and estimate > self.count_limit:
+                self.count_is_estimated = True
+                return estimate
+
+        count = queryset.order_by().values("pk")[: self.count_limit + 1].count()
+        self.count_is_estimated = count > self.count_limit
+        return min(count, self.count_limit)
+
+    count_is_estimated = False
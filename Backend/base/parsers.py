@@ -0,0 +1,49 @@
+import io
+import re
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# Integers of up to 18 digits always fit in 64 bits.
+LONG_NUMBER = re.compile(rb"[0-9]{19}")
+
+
+class FastJSONParser(JSONParser):
+    """
+    A drop-in replacement for the `JSONParser` that parses utf-8 request bodies
+    with orjson when it is installed. orjson rejects `NaN` and `Infinity` just
+    like the strict stock parser, other encodings fall back to the stock parser.
+
+    orjson differs from the stock parser on a few bodies, which are parsed by
+    the stock parser instead so that the results are the same:
+
+    - integers that don't fit in 64 bits are parsed as floats by orjson, so
+      bodies with a run of 19 digits or more skip orjson;
+    - every body rejected by orjson (escaped lone surrogates like `"\\ud800"`,
+      invalid JSON, ...) is parsed again, the stock parser either accepts it
+      or raises its own `ParseError`.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+
+        if orjson is None or not self.strict or encoding.lower() not in (
+            "utf-8",
+            "utf8",
+        ):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if LONG_NUMBER.search(body):
+            return super().parse(io.BytesIO(body), media_type, parser_context)
+
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
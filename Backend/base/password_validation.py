@@ -0,0 +1,237 @@
+import gzip
+import hashlib
+import heapq
+import logging
+import mmap
+import os
+import sys
+import tempfile
+import threading
+from array import array
+
+from django.conf import settings
+from django.contrib.auth.password_validation import CommonPasswordValidator
+from django.core.exceptions import ValidationError
+from django.utils.translation import gettext as _
+
+logger = logging.getLogger(__name__)
+
+# The file is a header followed by the sorted, deduplicated first 8 bytes of the
+# SHA-1 of every breached password, big-endian, so that comparing the raw bytes
+# compares the numbers.
+FILE_HEADER = b"BRPW\x00\x00\x00\x01"
+RECORD_SIZE = 8
+
+_mapped_files = {}
+_mapped_files_lock = threading.Lock()
+_missing_files = set()
+_common_password_validator = None
+
+
+def password_digest(password):
+    return hashlib.sha1(password.encode("utf-8", "surrogatepass")).digest()[:RECORD_SIZE]
+
+
+def _open_mapped_file(path):
+    """
+    Memory-maps the file once per process. The pages are read-only and backed by
+    the file, so all the workers of a host share them through the page cache.
+
+    A missing or invalid file isn't cached, it is picked up as soon as it is
+    built, and the warning is only logged once per path.
+
+    :return: The mapped file, or None if it doesn't exist or is invalid.
+    :rtype: mmap.mmap | None
+    """
+
+    with _mapped_files_lock:
+        if path in _mapped_files:
+            return _mapped_files[path]
+
+        mapped = None
+        problem = "missing"
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            pass
+
+        if mapped is not None and (
+            mapped[: len(FILE_HEADER)] != FILE_HEADER
+            or (len(mapped) - len(FILE_HEADER)) % RECORD_SIZE
+        ):
+            mapped.close()
+            mapped = None
+            problem = "invalid"
+
+        if mapped is None:
+            if path not in _missing_files:
+                _missing_files.add(path)
+                logger.warning(
+                    "Breached password file %s is %s, falling back to the "
+                    "common password list.",
+                    path,
+                    problem,
+                )
+            return None
+
+        _missing_files.discard(path)
+        _mapped_files[path] = mapped
+        return mapped
+
+
+def _get_common_password_validator():
+    global _common_password_validator
+
+    with _mapped_files_lock:
+        if _common_password_validator is None:
+            _common_password_validator = CommonPasswordValidator()
+        return _common_password_validator
+
+
+def _contains(mapped, digest):
+    # Binary search over the fixed size records.
+    low = 0
+    high = (len(mapped) - len(FILE_HEADER)) // RECORD_SIZE
+
+    while low < high:
+        middle = (low + high) // 2
+        offset = len(FILE_HEADER) + middle * RECORD_SIZE
+        record = mapped[offset : offset + RECORD_SIZE]
+        if record < digest:
+            low = middle + 1
+        elif record > digest:
+            high = middle
+        else:
+            return True
+
+    return False
+
+
+class BreachedPasswordValidator:
+    """
+    Validate that the password is not part of a breached password corpus.
+
+    Unlike the `CommonPasswordValidator` which loads its list in a set in every
+    process, the corpus is looked up with a binary search in a memory-mapped
+    file, built with the `build_breached_passwords` management command. Until
+    the file is built, passwords are checked against the list of the
+    `CommonPasswordValidator`.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or settings.BREACHED_PASSWORDS_FILE)
+
+    def is_breached(self, password):
+        mapped = _open_mapped_file(self.path)
+        if mapped is None:
+            common_passwords = _get_common_password_validator().passwords
+            return password.lower().strip() in common_passwords
+
+        # The lowercase variant catches corpora that are lowercased, like the
+        # one of the `CommonPasswordValidator`.
+        candidates = {password, password.lower().strip()}
+        return any(
+            _contains(mapped, password_digest(candidate)) for candidate in candidates
+        )
+
+    def validate(self, password, user=None):
+        if _open_mapped_file(self.path) is None:
+            _get_common_password_validator().validate(password, user)
+        elif self.is_breached(password):
+            raise ValidationError(
+                _("This password has appeared in a data breach."),
+                code="password_breached",
+            )
+
+    def __call__(self, value):
+        # Allows the validator to be used as a serializer field validator.
+        self.validate(value)
+
+    def get_help_text(self):
+        return _("Your password can’t be a password that appeared in a data breach.")
+
+
+def _iter_sorted_run(path):
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(RECORD_SIZE * 8192)
+            if not block:
+                return
+            for offset in range(0, len(block), RECORD_SIZE):
+                yield block[offset : offset + RECORD_SIZE]
+
+
+def build_breached_password_file(digests, path, chunk_size=2_000_000):
+    """
+    Writes the breached password file from an iterable of password digests. The
+    digests are sorted in runs of `chunk_size` on disk and merged, so that the
+    memory use is bounded whatever the size of the corpus.
+
+    :return: The number of distinct digests written.
+    :rtype: int
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    runs = []
+    chunk = array("Q")
+
+    def write_run():
+        run_array = array("Q", sorted(chunk))
+        if sys.byteorder == "little":
+            run_array.byteswap()
+        run = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        with run:
+            run.write(run_array.tobytes())
+        runs.append(run.name)
+        del chunk[:]
+
+    try:
+        for digest in digests:
+            chunk.append(int.from_bytes(digest, "big"))
+            if len(chunk) >= chunk_size:
+                write_run()
+        if chunk or not runs:
+            write_run()
+
+        count = 0
+        previous = None
+        output = tempfile.NamedTemporaryFile(dir=directory, delete=False)
+        with output:
+            output.write(FILE_HEADER)
+            for digest in heapq.merge(*(_iter_sorted_run(run) for run in runs)):
+                if digest != previous:
+                    output.write(digest)
+                    previous = digest
+                    count += 1
+        os.replace(output.name, path)
+    finally:
+        for run in runs:
+            os.remove(run)
+
+    return count
+
+
+def read_corpus(path, sha1=False):
+    """
+    Reads a corpus file, plain text or gzipped, with one entry per line.
+
+    :param sha1: The entries are SHA-1 hex digests, optionally followed by
+        `:<count>` like the Have I Been Pwned lists, instead of passwords.
+    :return: The digests of the entries.
+    :rtype: generator(bytes)
+    """
+
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line:
+                continue
+            if sha1:
+                try:
+                    yield bytes.fromhex(line.split(":", 1)[0].strip())[:RECORD_SIZE]
+                except ValueError:
+                    continue
+            else:
+                yield password_digest(line)
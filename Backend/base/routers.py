@@ -0,0 +1,44 @@
+from django.conf import settings
+
+from .sharding import get_user_shards, shard_for_email, shard_for_id
+
+
+class UserShardRouter:
+    """
+    Partitions the users across the databases listed in `USER_SHARDS`.
+
+    Queries that filter on the email address or the id are sent to the right
+    shard by the `UserQuerySet` itself, this router takes care of saving model
+    instances and of only creating the user table on the extra shards.
+    Everything else stays on the default database.
+    """
+
+    @staticmethod
+    def is_user_model(model):
+        return model._meta.label_lower == settings.AUTH_USER_MODEL.lower()
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if self.is_user_model(model) and instance is not None:
+            return instance._state.db
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get("instance")
+        if not self.is_user_model(model) or instance is None:
+            return None
+
+        if instance._state.db:
+            return instance._state.db
+        if instance.pk is not None:
+            return shard_for_id(instance.pk)
+        if instance.emailAddress:
+            return shard_for_email(instance.emailAddress)
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == "default" or db not in get_user_shards():
+            return None
+
+        # The other shards only hold the users.
+        return app_label == "base" and model_name == "baseuser"
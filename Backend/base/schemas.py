@@ -1,9 +1,14 @@
 from django.conf import settings
 
+from drf_spectacular.contrib.rest_framework_simplejwt import SimpleJWTScheme
 from drf_spectacular.plumbing import build_object_type
 from rest_framework_simplejwt.settings import api_settings as jwt_settings
 
 
+class JWTAuthenticationScheme(SimpleJWTScheme):
+    target_class = "base.authentication.JWTAuthentication"
+
+
 user_response_schema = {
     "user": {
         "type": "object",
@@ -1,12 +1,20 @@
 from rest_framework_simplejwt.serializers import (
+    PasswordField,
     TokenObtainPairSerializer,
     TokenRefreshSerializer,
 )
-from rest_framework import serializers
+from rest_framework import exceptions, serializers
 from django.contrib.auth import get_user_model
 from rest_framework.validators import UniqueValidator
 from drf_spectacular.utils import extend_schema_serializer
 
+from .activity import activity_buffer
+from .audit import audit_log
+from .models import ArchivedUser, AuthEvent
+from .password_validation import BreachedPasswordValidator
+from .tokens import RefreshToken
+from .validation import CompiledSerializerValidator
+
 
 User = get_user_model()
 
@@ -32,7 +40,9 @@ class PublicUserSerializer(serializers.ModelSerializer):
 
 class ResetPasswordBodyValidationSerializer(serializers.Serializer):
     token = serializers.CharField()
-    password = serializers.CharField(min_length=6)
+    password = serializers.CharField(
+        min_length=6, validators=[BreachedPasswordValidator()]
+    )
 
 
 class SendResetPasswordEmailBodyValidationSerializer(serializers.Serializer):
@@ -48,26 +58,53 @@ class SendResetPasswordEmailBodyValidationSerializer(serializers.Serializer):
 
 class ChangePasswordBodyValidationSerializer(serializers.Serializer):
     oldPassword = serializers.CharField(min_length=6)
-    newPassword = serializers.CharField(min_length=6)
+    newPassword = serializers.CharField(
+        min_length=6, validators=[BreachedPasswordValidator()]
+    )
 
 
 class RegisterSerializer(serializers.Serializer):
     emailAddress = serializers.EmailField(
         help_text="The email address is also going to be the username.",
-        validators=[UniqueValidator(queryset=User.objects.all())],
+        validators=[
+            UniqueValidator(queryset=User.objects.all()),
+            UniqueValidator(queryset=ArchivedUser.objects.all()),
+        ],
     )
     firstName = serializers.CharField(min_length=2, max_length=150)
     lastName = serializers.CharField(min_length=2, max_length=150, required=False)
-    password = serializers.CharField(min_length=6)
+    password = serializers.CharField(
+        min_length=6, validators=[BreachedPasswordValidator()]
+    )
 
 
 class TokenObtainPairWithUserSerializer(TokenObtainPairSerializer):
+    emailAddress = serializers.CharField(write_only=True)
+    password = PasswordField()
+
+    def __init__(self, *args, **kwargs):
+        # The credential fields are declared on the class, so the parent
+        # constructor that adds them to a fresh copy of the fields is skipped.
+        serializers.Serializer.__init__(self, *args, **kwargs)
+
     @classmethod
     def get_token(cls, user):
         return super().get_token(user)
 
     def validate(self, attrs):
-        data = super().validate(attrs)
+        request = self.context.get("request")
+        try:
+            data = super().validate(attrs)
+        except exceptions.AuthenticationFailed:
+            audit_log.record(
+                AuthEvent.Event.LOGIN_FAILED,
+                email=attrs.get(self.username_field, ""),
+                request=request,
+            )
+            raise
+
+        activity_buffer.record(self.user, login=True)
+        audit_log.record(AuthEvent.Event.LOGIN, self.user, request=request)
         user = {
             "user": {
                 "firstName": self.user.firstName,
@@ -85,13 +122,10 @@ class TokenRefreshWithUserSerializer(TokenRefreshSerializer):
     token = serializers.CharField(
         required=False, help_text="Deprecated. Use `refresh_token` instead."
     )
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        del self.fields["refresh"]
+    refresh = None
+    token_class = RefreshToken
 
     def validate(self, attrs):
-        print("---------------------------------")
         attrs["refresh"] = attrs.pop("refresh_token", attrs.get("token"))
         data = super().validate(attrs)
         tokens = {
@@ -99,3 +133,18 @@ class TokenRefreshWithUserSerializer(TokenRefreshSerializer):
             "access_token": data["access"],
         }
         return tokens
+
+
+register_body_validator = CompiledSerializerValidator(RegisterSerializer)
+change_password_body_validator = CompiledSerializerValidator(
+    ChangePasswordBodyValidationSerializer
+)
+reset_password_body_validator = CompiledSerializerValidator(
+    ResetPasswordBodyValidationSerializer
+)
+token_obtain_body_validator = CompiledSerializerValidator(
+    TokenObtainPairWithUserSerializer
+)
+token_refresh_body_validator = CompiledSerializerValidator(
+    TokenRefreshWithUserSerializer
+)
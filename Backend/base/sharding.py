@@ -0,0 +1,131 @@
+import hashlib
+
+from django.conf import settings
+
+# Every shard allocates the ids of its users from its own range, the index of
+# the shard being `id >> SHARD_ID_BITS`. An id, e.g. the `user_id` claim of a
+# JWT, is therefore enough to find the shard of a user without a fan-out.
+SHARD_ID_BITS = 48
+
+# The users created before the sharding stay on the default database, lookups
+# by email address fall back to it.
+LEGACY_SHARD = "default"
+
+EMAIL_LOOKUPS = ("emailAddress", "emailAddress__exact", "emailAddress__iexact")
+ID_LOOKUPS = ("pk", "pk__exact", "id", "id__exact")
+ID_IN_LOOKUPS = ("pk__in", "id__in")
+
+
+class ShardRoutingError(Exception):
+    """
+    Raised when a query on the users can't be sent to a single shard.
+    """
+
+
+def get_user_shards():
+    """
+    :return: The database aliases the users are partitioned across.
+    :rtype: tuple
+    """
+
+    return tuple(getattr(settings, "USER_SHARDS", ("default",)))
+
+
+def is_sharded():
+    return len(get_user_shards()) > 1
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+def shard_for_email(email):
+    """
+    Picks the shard of an email address with a stable hash of the normalized
+    address, so that it doesn't change between processes and restarts.
+
+    :rtype: str
+    """
+
+    shards = get_user_shards()
+    digest = hashlib.blake2b(
+        normalize_email(email).encode(), digest_size=8
+    ).digest()
+    return shards[int.from_bytes(digest, "big") % len(shards)]
+
+
+def shard_for_id(pk):
+    """
+    :return: The shard whose id range contains the id, or None if there is none.
+    :rtype: str | None
+    """
+
+    shards = get_user_shards()
+    try:
+        index = int(pk) >> SHARD_ID_BITS
+    except (TypeError, ValueError):
+        return None
+
+    if 0 <= index < len(shards):
+        return shards[index]
+    return None
+
+
+def shard_id_offset(alias):
+    """
+    :return: The first id of the range of the given shard.
+    :rtype: int
+    """
+
+    return get_user_shards().index(alias) << SHARD_ID_BITS
+
+
+def legacy_shard_for_email(email):
+    """
+    :return: The shard that can also hold the user with the email address, if
+        that user was created before the sharding, or None if it's the shard
+        the address hashes to anyway.
+    :rtype: str | None
+    """
+
+    if LEGACY_SHARD not in get_user_shards() or shard_for_email(email) == LEGACY_SHARD:
+        return None
+    return LEGACY_SHARD
+
+
+def email_for_lookups(lookups):
+    """
+    :return: The email address the lookups filter on, or None.
+    :rtype: str | None
+    """
+
+    for name in EMAIL_LOOKUPS:
+        if isinstance(lookups.get(name), str):
+            return lookups[name]
+    return None
+
+
+def shard_for_lookups(lookups):
+    """
+    Finds the single shard that can hold the rows matched by the lookups of a
+    `filter()` call, based on the email address or the id.
+
+    :return: The shard, or None if the lookups don't pin a single shard.
+    :rtype: str | None
+    """
+
+    email = email_for_lookups(lookups)
+    if email is not None:
+        return shard_for_email(email)
+
+    for name in ID_LOOKUPS:
+        if name in lookups:
+            return shard_for_id(lookups[name])
+
+    for name in ID_IN_LOOKUPS:
+        if isinstance(lookups.get(name), (list, tuple, set)):
+            shards = {shard_for_id(pk) for pk in lookups[name]}
+            if len(shards) == 1:
+                return shards.pop()
+
+    return None
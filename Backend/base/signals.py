@@ -0,0 +1,6 @@
+from django.dispatch import Signal
+
+# Sent with `user_ids` whenever the authentication state (active flag, admin
+# flag, issued tokens) of a group of users is changed in bulk, so that anything
+# caching that state can drop it.
+users_auth_changed = Signal()
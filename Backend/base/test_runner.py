@@ -0,0 +1,19 @@
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Disables the process-wide audit log and activity buffer during the tests.
+    Their batches would otherwise be written by their background threads, and
+    at exit into the real databases once the test ones are destroyed. The tests
+    of the buffers use their own instances.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+
+        from .activity import activity_buffer
+        from .audit import audit_log
+
+        audit_log.disable()
+        activity_buffer.disable()
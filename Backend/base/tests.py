@@ -1,3 +1,1287 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import admin
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, connections
+from django.http import HttpResponse
+from django.test import (
+    Client,
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils.timezone import now
+from django.views import View
+from rest_framework import serializers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .activity import ActivityBuffer, activity_buffer
+from .archive import archive_users, get_dormant_users
+from .admin import UserAdmin
+from .audit import AuditLog, audit_log
+from .forms import UserCreationForm
+from .authentication import is_token_revoked
+from .forward_auth import verified_token_cache
+from .idempotency import IdempotentViewMixin
+from .models import ArchivedUser, AuthEvent
+from .exports import EXPORT_FIELDS
+from .paginators import EstimatedCountPaginator
+from .parsers import FastJSONParser
+from .renderers import FastJSONRenderer
+from .password_validation import (
+    BreachedPasswordValidator,
+    build_breached_password_file,
+    password_digest,
+)
+from .serializers import (
+    ChangePasswordBodyValidationSerializer,
+    RegisterSerializer,
+    ResetPasswordBodyValidationSerializer,
+    TokenObtainPairWithUserSerializer,
+    TokenRefreshWithUserSerializer,
+    change_password_body_validator,
+    register_body_validator,
+    reset_password_body_validator,
+    token_obtain_body_validator,
+    token_refresh_body_validator,
+)
+from .signals import users_auth_changed
+from .views import RESET_REQUEST_PENDING, get_reset_request_cache_key
+from .sharding import (
+    SHARD_ID_BITS,
+    ShardRoutingError,
+    get_user_shards,
+    is_sharded,
+    shard_for_email,
+)
+
+User = get_user_model()
+
+PASSWORD = "Zq9!long-unique-pass"
+
+
+def email_on_shard(shard, prefix="user"):
+    """
+    :return: An email address that hashes to the given shard.
+    :rtype: str
+    """
+
+    for i in itertools.count():
+        email = "{prefix}{i}@example.com".format(prefix=prefix, i=i)
+        if shard_for_email(email) == shard:
+            return email
+
+
+def explain(queryset):
+    """
+    :return: The SQLite query plan of the queryset, one step per line.
+    :rtype: str
+    """
+
+    sql, params = queryset.query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return "\n".join(row[-1] for row in cursor.fetchall())
+
+
+def create_user(email, password=PASSWORD, **kwargs):
+    kwargs.setdefault("firstName", "Ada")
+    user = User(emailAddress=email, **kwargs)
+    user.set_password(password)
+    user.save()
+    return user
+
+
+class UserTestCase(TestCase):
+    # The users may live on any of the shards.
+    databases = "__all__"
+
+
+@skipUnless(is_sharded(), "USER_SHARDS lists a single database.")
+class ShardedTestCase(UserTestCase):
+    @property
+    def other_shard(self):
+        return get_user_shards()[1]
+
+
+class UserShardRoutingTests(ShardedTestCase):
+    def test_users_are_created_on_the_shard_of_their_email(self):
+        for shard in get_user_shards():
+            user = create_user(email_on_shard(shard))
+            self.assertEqual(user._state.db, shard)
+            self.assertTrue(User.objects.using(shard).filter(pk=user.pk).exists())
+
+    def test_ids_are_allocated_from_the_range_of_the_shard(self):
+        for index, shard in enumerate(get_user_shards()):
+            first = create_user(email_on_shard(shard, "first"))
+            second = create_user(email_on_shard(shard, "second"))
+            self.assertEqual(first.pk >> SHARD_ID_BITS, index)
+            self.assertEqual(second.pk >> SHARD_ID_BITS, index)
+            self.assertGreater(second.pk, first.pk)
+
+    def test_lookups_by_email_and_id_are_routed(self):
+        user = create_user(email_on_shard(self.other_shard))
+
+        by_email = User.objects.filter(emailAddress=user.emailAddress)
+        self.assertEqual(by_email.db, self.other_shard)
+        self.assertEqual(by_email.get(), user)
+        self.assertEqual(User.objects.filter(pk=user.pk).db, self.other_shard)
+        self.assertEqual(User.objects.get(id=user.pk), user)
+
+    def test_unrouted_queries_fail_loudly(self):
+        create_user(email_on_shard(self.other_shard))
+
+        with self.assertRaises(ShardRoutingError):
+            User.objects.count()
+        with self.assertRaises(ShardRoutingError):
+            list(User.objects.filter(is_admin=False))
+
+        total = sum(queryset.count() for queryset in User.objects.per_shard())
+        self.assertEqual(total, 1)
+
+    def test_users_created_before_sharding_are_found_on_default(self):
+        email = email_on_shard(self.other_shard, "legacy")
+        legacy = User(emailAddress=email, firstName="Ada")
+        legacy.set_password(PASSWORD)
+        legacy.save(using="default")
+
+        self.assertEqual(User.objects.get(emailAddress=email), legacy)
+        self.assertTrue(User.objects.filter(emailAddress=email).exists())
+        self.assertEqual(User.objects.filter(emailAddress=email).count(), 1)
+        self.assertEqual(authenticate(emailAddress=email, password=PASSWORD), legacy)
+
+    def test_email_is_unique_across_shards(self):
+        email = email_on_shard(self.other_shard, "legacy")
+        User(emailAddress=email, firstName="Ada").save(using="default")
+
+        with self.assertRaises(IntegrityError):
+            User.objects.create_user(email, "Ada", PASSWORD)
+
+        response = self.client.post(
+            reverse("register_user"),
+            {"emailAddress": email, "firstName": "Ada", "password": PASSWORD},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("emailAddress", response.json())
+        self.assertFalse(
+            User.objects.using(self.other_shard).filter(emailAddress=email).exists()
+        )
+
+
+class ShardedAuthFlowTests(ShardedTestCase):
+    def test_register(self):
+        email = email_on_shard(self.other_shard, "register")
+        response = self.client.post(
+            reverse("register_user"),
+            {"emailAddress": email, "firstName": "Ada", "password": PASSWORD},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.using(self.other_shard).get(emailAddress=email)
+        self.assertEqual(user.pk >> SHARD_ID_BITS, 1)
+
+    def test_login_and_authenticated_request(self):
+        user = create_user(email_on_shard(self.other_shard, "login"))
+
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"emailAddress": user.emailAddress, "password": PASSWORD},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.post(
+            reverse("change_user_password"),
+            {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer " + response.json()["access_token"],
+        )
+        self.assertEqual(response.status_code, 204)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password("An0ther-long-pass!"))
+
+    def test_reset_password(self):
+        user = create_user(email_on_shard(self.other_shard, "reset"))
+
+        response = self.client.post(
+            reverse("forgot_password"),
+            {"emailAddress": user.emailAddress, "base_url": "http://localhost/"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        token = re.search(r"http://localhost/([\w.:-]+)", mail.outbox[0].body)[1]
+
+        response = self.client.post(
+            reverse("reset_password"),
+            {"token": token, "password": "An0ther-long-pass!"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password("An0ther-long-pass!"))
+
+
+class ShardedAdminTests(ShardedTestCase):
+    def setUp(self):
+        self.admin = create_user("admin@example.com", is_admin=True)
+        self.client.force_login(self.admin)
+        self.users = [
+            create_user(email_on_shard(shard, "admin-list-{n}-".format(n=n)))
+            for shard in get_user_shards()
+            for n in range(2)
+        ]
+
+    def test_changelist_lists_the_users_of_every_shard(self):
+        response = self.client.get(reverse("admin:base_baseuser_changelist"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["cl"].is_fan_out)
+        listed = [user.emailAddress for user in response.context["cl"].result_list]
+        expected = sorted(
+            [user.emailAddress for user in self.users] + [self.admin.emailAddress]
+        )
+        self.assertEqual(listed, expected)
+
+    def test_changelist_keyset_pages_across_shards(self):
+        url = reverse("admin:base_baseuser_changelist")
+        seen = []
+        query = ""
+        with mock.patch.object(UserAdmin, "list_per_page", 2):
+            while query is not None:
+                cl = self.client.get(url + query).context["cl"]
+                seen.extend(user.emailAddress for user in cl.result_list)
+                query = cl.get_next_keyset_url()
+
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(seen), len(self.users) + 1)
+
+    def test_changelist_search_across_shards(self):
+        response = self.client.get(
+            reverse("admin:base_baseuser_changelist"), {"q": "admin-list"}
+        )
+
+        self.assertEqual(len(response.context["cl"].result_list), len(self.users))
+
+    def test_bulk_action_updates_every_shard(self):
+        with self.assertLogs("base.audit", "INFO"):
+            response = self.client.post(
+                reverse("admin:base_baseuser_changelist"),
+                {
+                    "action": "deactivate_users",
+                    "select_across": "1",
+                    "index": "0",
+                    "_selected_action": [self.users[0].pk],
+                },
+            )
+
+        self.assertEqual(response.status_code, 302)
+        for user in self.users:
+            user.refresh_from_db()
+            self.assertFalse(user.is_active)
+        self.admin.refresh_from_db()
+        self.assertTrue(self.admin.is_active)
+
+
+@skipUnless(connections["default"].vendor == "sqlite", "The plans are SQLite's.")
+class UserChangelistScalingTests(TestCase):
+    seeded_users = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.using("default").bulk_create(
+            User(
+                emailAddress="member{i:05d}@example.com".format(i=i),
+                firstName="First{i:05d}".format(i=i),
+                lastName="Last{i:05d}".format(i=i),
+            )
+            for i in range(cls.seeded_users)
+        )
+        with connections["default"].cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def search(self, term):
+        request = RequestFactory().get("/")
+        queryset, _ = UserAdmin(User, admin.site).get_search_results(
+            request, User.objects.using("default"), term
+        )
+        return queryset.order_by("emailAddress")
+
+    def test_search_uses_the_search_indexes(self):
+        plan = explain(self.search("First123"))
+
+        for index in (
+            "base_user_email_search_idx",
+            "base_user_first_name_search_idx",
+            "base_user_last_name_search_idx",
+        ):
+            self.assertIn(index, plan)
+        self.assertNotIn("SCAN base_baseuser", plan)
+        self.assertEqual(
+            [user.firstName for user in self.search("first12345")], ["First12345"]
+        )
+
+    def test_keyset_page_uses_the_email_index(self):
+        page = (
+            User.objects.using("default")
+            .filter(emailAddress__gt="member15000@example.com")
+            .order_by("emailAddress")[:100]
+        )
+        plan = explain(page)
+
+        self.assertIn("USING INDEX", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+        self.assertEqual(page[0].emailAddress, "member15001@example.com")
+
+    def test_count_is_estimated_or_capped(self):
+        users = User.objects.using("default").order_by("emailAddress")
+
+        everyone = EstimatedCountPaginator(users, 100)
+        self.assertEqual(everyone.count, self.seeded_users)
+        self.assertTrue(everyone.count_is_estimated)
+
+        filtered = EstimatedCountPaginator(
+            users.filter(firstName__istartswith="first"), 100
+        )
+        self.assertEqual(filtered.count, filtered.count_limit)
+        self.assertTrue(filtered.count_is_estimated)
+
+
+class ForceLogoutTests(UserTestCase):
+    def setUp(self):
+        self.user = create_user("logout@example.com")
+
+    def test_tokens_issued_before_the_logout_are_revoked(self):
+        token = AccessToken.for_user(self.user)
+        token["iat"] -= 1
+
+        self.assertTrue(is_token_revoked(now(), token))
+
+    def test_tokens_issued_in_the_same_second_after_the_logout_are_valid(self):
+        logged_out_at = now()
+        token = AccessToken.for_user(self.user)
+
+        self.assertFalse(is_token_revoked(logged_out_at, token))
+
+    def test_force_logout_rejects_the_existing_tokens(self):
+        token = AccessToken.for_user(self.user)
+        token["iat"] -= 1
+        access = str(token)
+        self.user.tokens_valid_after = now()
+        self.user.save()
+
+        response = self.client.post(
+            reverse("change_user_password"),
+            {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer " + access,
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class ActivityBufferTests(UserTestCase):
+    def setUp(self):
+        self.buffer = ActivityBuffer()
+        patcher = mock.patch.object(ActivityBuffer, "_ensure_worker")
+        self.ensure_worker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_record_defers_the_write_to_the_background_flush(self):
+        seen_at = now() - datetime.timedelta(hours=1)
+        user = create_user("activity@example.com", last_seen=seen_at)
+
+        self.buffer.record(user, login=True)
+        self.ensure_worker.assert_called_once_with()
+        user.refresh_from_db()
+        self.assertEqual(user.last_seen, seen_at)
+
+        self.buffer.flush()
+        user.refresh_from_db()
+        self.assertGreater(user.last_seen, seen_at)
+        self.assertEqual(user.last_login, user.last_seen)
+
+    def test_first_activity_after_a_long_absence_is_written_right_away(self):
+        seen_at = now() - datetime.timedelta(days=2)
+        user = create_user("absent@example.com", last_seen=seen_at)
+
+        self.buffer.record(user)
+
+        user.refresh_from_db()
+        self.assertGreater(user.last_seen, seen_at)
+        self.assertIsNone(user.last_login)
+
+
+    def test_disabled_buffer_ignores_the_activity(self):
+        user = create_user("disabled@example.com")
+        self.buffer.disable()
+
+        self.buffer.record(user, login=True)
+
+        self.assertEqual(self.buffer.pending, {})
+        user.refresh_from_db()
+        self.assertIsNone(user.last_seen)
+
+    def test_process_wide_buffer_is_disabled_by_the_test_runner(self):
+        self.assertFalse(activity_buffer.enabled)
+
+
+class BreachedPasswordValidatorTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "breached_passwords.bin")
+
+    def test_missing_file_falls_back_to_the_common_passwords(self):
+        validator = BreachedPasswordValidator(self.path)
+
+        self.assertTrue(validator.is_breached("password"))
+        with self.assertRaises(ValidationError) as caught:
+            validator.validate("password")
+        self.assertEqual(caught.exception.error_list[0].code, "password_too_common")
+        validator.validate(PASSWORD)
+
+    def test_file_built_later_is_picked_up(self):
+        validator = BreachedPasswordValidator(self.path)
+        self.assertFalse(validator.is_breached(PASSWORD))
+
+        build_breached_password_file([password_digest(PASSWORD)], self.path)
+
+        self.assertTrue(validator.is_breached(PASSWORD))
+        with self.assertRaises(ValidationError) as caught:
+            validator.validate(PASSWORD)
+        self.assertEqual(caught.exception.error_list[0].code, "password_breached")
+
+
+class SlowView(IdempotentViewMixin, View):
+    idempotency_lock_timeout = 0.2
+
+    def post(self, request):
+        time.sleep(0.5)
+        cache_key = self.get_idempotency_cache_key(request, "slow")
+        self.lock_held = caches[settings.IDEMPOTENCY_CACHE].get(cache_key + ":lock")
+        return HttpResponse("done")
+
+
+class IdempotencyTests(UserTestCase):
+    def register(self, email, key):
+        return self.client.post(
+            reverse("register_user"),
+            {"emailAddress": email, "firstName": "Ada", "password": PASSWORD},
+            content_type="application/json",
+            HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retries_are_replayed(self):
+        email = "idempotent@example.com"
+
+        first = self.register(email, "replayed")
+        retry = self.register(email, "replayed")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.content, first.content)
+
+    def test_responses_with_tokens_are_kept_shortly(self):
+        cache = caches[settings.IDEMPOTENCY_CACHE]
+        with mock.patch.object(cache, "set", wraps=cache.set) as cache_set:
+            self.register("ttl@example.com", "ttl")
+
+        self.assertEqual(
+            cache_set.call_args.kwargs["timeout"],
+            settings.IDEMPOTENCY_TOKEN_RESPONSE_TTL,
+        )
+        self.assertLess(
+            settings.IDEMPOTENCY_TOKEN_RESPONSE_TTL, settings.IDEMPOTENCY_KEY_TTL
+        )
+
+    def test_lock_is_refreshed_while_the_view_runs(self):
+        view = SlowView()
+        request = RequestFactory().post("/slow/", HTTP_IDEMPOTENCY_KEY="slow")
+        view.setup(request)
+
+        response = view.dispatch(request)
+
+        self.assertEqual(response.content, b"done")
+        self.assertTrue(view.lock_held)
+
+
+class ReadinessTests(UserTestCase):
+    @mock.patch("base.views.is_ready", return_value=True)
+    def test_ready_once_warmed_up_with_the_databases_up(self, is_ready):
+        response = self.client.get(reverse("readyz"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"status": "ready"})
+
+    @mock.patch("base.views.is_ready", return_value=True)
+    def test_not_ready_when_a_database_is_down(self, is_ready):
+        connection = connections[get_user_shards()[-1]]
+        with mock.patch.object(connection, "cursor", side_effect=OperationalError):
+            with self.assertLogs("base.warmup", "ERROR"):
+                response = self.client.get(reverse("readyz"))
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {"status": "database_unavailable"})
+
+
+class ForwardAuthTests(UserTestCase):
+    def setUp(self):
+        self.user = create_user("forward@example.com")
+        self.access = str(AccessToken.for_user(self.user))
+        verified_token_cache.clear()
+        self.addCleanup(verified_token_cache.clear)
+
+    def verify(self, access=None):
+        return self.client.get(
+            reverse("verify_token"),
+            HTTP_AUTHORIZATION="Bearer " + (access or self.access),
+        )
+
+    def test_valid_token_sets_the_identity_headers(self):
+        response = self.verify()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-User-Id"], str(self.user.pk))
+        self.assertEqual(response["X-User-Email"], self.user.emailAddress)
+        self.assertEqual(response["Cache-Control"], "no-store")
+        self.assertEqual(response.content, b"")
+
+    def test_invalid_or_missing_token_is_rejected(self):
+        missing = self.client.get(reverse("verify_token"))
+        for response in (self.verify("not-a-token"), missing):
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response["WWW-Authenticate"], 'Bearer realm="api"')
+            self.assertFalse(response.has_header("X-User-Id"))
+
+    def test_users_auth_changed_drops_the_cached_tokens(self):
+        self.assertEqual(self.verify().status_code, 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.verify().status_code, 200)
+
+        users_auth_changed.send(sender=User, user_ids=[self.user.pk])
+
+        self.assertEqual(self.verify().status_code, 401)
+
+    def test_any_method_is_accepted_without_csrf_token(self):
+        client = Client(enforce_csrf_checks=True)
+        url = reverse("verify_token")
+        authorization = "Bearer " + self.access
+
+        for method in (client.get, client.head):
+            response = method(url, HTTP_AUTHORIZATION=authorization)
+            self.assertEqual(response.status_code, 200)
+        # The body of the original request is passed along by some proxies.
+        for method in (client.post, client.put, client.patch, client.delete):
+            response = method(
+                url,
+                "{not json",
+                content_type="application/json",
+                HTTP_AUTHORIZATION=authorization,
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["X-User-Id"], str(self.user.pk))
+
+
+class StopWorker(Exception):
+    pass
+
+
+@override_settings(AUDIT_BATCH_SIZE=3, AUDIT_FLUSH_INTERVAL=7)
+class AuditLogTests(TestCase):
+    def setUp(self):
+        self.audit_log = AuditLog()
+        patcher = mock.patch.object(AuditLog, "_ensure_worker")
+        self.ensure_worker = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, count):
+        for i in range(count):
+            self.audit_log.record(
+                AuthEvent.Event.LOGIN_FAILED, email="audit{i}@example.com".format(i=i)
+            )
+
+    def test_full_batch_wakes_the_worker_up(self):
+        self.record(2)
+        self.assertFalse(self.audit_log.wake_up.is_set())
+        self.assertFalse(AuthEvent.objects.exists())
+
+        self.record(1)
+        self.assertTrue(self.audit_log.wake_up.is_set())
+        self.ensure_worker.assert_called_with()
+
+    def test_worker_flushes_every_interval(self):
+        self.record(1)
+
+        with mock.patch.object(
+            self.audit_log.wake_up, "wait", return_value=False
+        ) as wait, mock.patch.object(
+            AuditLog, "flush", autospec=True, side_effect=[None, StopWorker]
+        ) as flush:
+            with self.assertRaises(StopWorker):
+                self.audit_log._run()
+
+        wait.assert_called_with(7)
+        self.assertEqual(flush.call_count, 2)
+
+    def test_flush_writes_the_batch_at_once(self):
+        self.record(3)
+
+        with self.assertNumQueries(1):
+            self.audit_log.flush()
+        self.assertEqual(AuthEvent.objects.count(), 3)
+        self.assertEqual(self.audit_log.pending, [])
+
+
+    def test_disabled_log_ignores_the_events(self):
+        self.audit_log.disable()
+        self.record(3)
+
+        self.assertEqual(self.audit_log.pending, [])
+        self.assertFalse(self.audit_log.wake_up.is_set())
+        self.ensure_worker.assert_not_called()
+
+    def test_process_wide_log_is_disabled_by_the_test_runner(self):
+        self.assertFalse(audit_log.enabled)
+
+
+class PruneAuditEventsTests(TestCase):
+    def test_deletes_the_events_older_than_the_retention(self):
+        timestamp = now()
+        AuthEvent.objects.bulk_create(
+            AuthEvent(
+                event=AuthEvent.Event.LOGIN,
+                created_at=timestamp - datetime.timedelta(days=days, hours=1),
+            )
+            for days in (0, 1, 29, 30, 31, 45, 45, 45, 100)
+        )
+        out = io.StringIO()
+
+        call_command("prune_audit_events", days=30, chunk_size=2, stdout=out)
+
+        kept = AuthEvent.objects.order_by("created_at").values_list(
+            "created_at", flat=True
+        )
+        self.assertEqual(len(kept), 3)
+        cutoff = timestamp - datetime.timedelta(days=30)
+        self.assertTrue(all(created_at > cutoff for created_at in kept))
+        self.assertIn("Deleted 6 events", out.getvalue())
+
+
+class ArchiveUsersTests(UserTestCase):
+    def setUp(self):
+        self.activity_buffer = ActivityBuffer()
+        patcher = mock.patch("base.archive.activity_buffer", self.activity_buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.long_ago = now() - datetime.timedelta(days=400)
+        self.dormant = [
+            create_user(email_on_shard(shard, "dormant"), last_seen=self.long_ago)
+            for shard in get_user_shards()
+        ]
+        self.active = create_user("active@example.com", last_seen=now())
+
+    def archive(self):
+        cutoff = now() - datetime.timedelta(days=365)
+        return sum(archive_users(get_dormant_users(cutoff), chunk_size=1))
+
+    def test_dormant_users_are_moved_to_the_archive(self):
+        self.assertEqual(self.archive(), len(self.dormant))
+
+        for user in self.dormant:
+            self.assertFalse(
+                User.objects.using(user._state.db).filter(pk=user.pk).exists()
+            )
+            self.assertTrue(ArchivedUser.objects.filter(pk=user.pk).exists())
+        self.assertTrue(User.objects.filter(pk=self.active.pk).exists())
+
+    def test_buffered_activity_is_flushed_before_the_check(self):
+        user = self.dormant[0]
+        with mock.patch.object(ActivityBuffer, "_ensure_worker"), mock.patch(
+            "base.activity.WRITE_THROUGH_AFTER", datetime.timedelta.max
+        ):
+            self.activity_buffer.record(user)
+
+        self.assertEqual(self.archive(), len(self.dormant) - 1)
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_login_restores_the_archived_user(self):
+        user = self.dormant[-1]
+        self.archive()
+
+        self.assertEqual(
+            authenticate(emailAddress=user.emailAddress, password=PASSWORD), user
+        )
+        restored = User.objects.using(user._state.db).get(pk=user.pk)
+        self.assertGreater(restored.last_seen, self.long_ago)
+        self.assertFalse(ArchivedUser.objects.filter(pk=user.pk).exists())
+
+    def test_access_token_restores_the_archived_user(self):
+        user = self.dormant[-1]
+        access = str(AccessToken.for_user(user))
+        self.archive()
+
+        response = self.client.post(
+            reverse("change_user_password"),
+            {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer " + access,
+        )
+
+        self.assertEqual(response.status_code, 204)
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_refresh_token_restores_the_archived_user(self):
+        user = self.dormant[-1]
+        refresh = str(RefreshToken.for_user(user))
+        self.archive()
+
+        response = self.client.post(
+            reverse("token_refresh"),
+            {"refresh_token": refresh},
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+
+    def test_email_of_an_archived_user_cant_be_reused(self):
+        email = self.dormant[-1].emailAddress
+        self.archive()
+
+        with self.assertRaises(IntegrityError):
+            create_user(email)
+
+        form = UserCreationForm(
+            {
+                "emailAddress": email,
+                "firstName": "Ada",
+                "password1": PASSWORD,
+                "password2": PASSWORD,
+            }
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("emailAddress", form.errors)
+
+    def test_archived_user_whose_email_is_taken_isnt_restored(self):
+        user = self.dormant[-1]
+        access = str(AccessToken.for_user(user))
+        self.archive()
+        # Bypasses the checks of `save`, like a user created before them.
+        User.objects.using(user._state.db).bulk_create(
+            [User(emailAddress=user.emailAddress, firstName="Taken")]
+        )
+
+        with self.assertLogs("base.models", "WARNING"):
+            response = self.client.post(
+                reverse("change_user_password"),
+                {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+                content_type="application/json",
+                HTTP_AUTHORIZATION="Bearer " + access,
+            )
+
+        self.assertEqual(response.status_code, 401)
+        self.assertTrue(ArchivedUser.objects.filter(pk=user.pk).exists())
+
+
+class ResetPasswordCoalescingTests(UserTestCase):
+    def setUp(self):
+        caches["default"].clear()
+        self.addCleanup(caches["default"].clear)
+        self.email = "coalesce@example.com"
+
+    def forgot_password(self, base_url="http://localhost/"):
+        return self.client.post(
+            reverse("forgot_password"),
+            {"emailAddress": self.email, "base_url": base_url},
+            content_type="application/json",
+        )
+
+    def test_repeated_requests_send_one_email(self):
+        create_user(self.email)
+
+        responses = [self.forgot_password() for _ in range(3)]
+
+        self.assertEqual([response.status_code for response in responses], [200] * 3)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_requests_for_another_link_are_not_coalesced(self):
+        create_user(self.email)
+
+        self.forgot_password("http://localhost/")
+        self.forgot_password("https://app.example.com/reset/")
+
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertIn("https://app.example.com/reset/", mail.outbox[1].body)
+
+    def test_unknown_address_is_not_kept(self):
+        response = self.forgot_password()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "USER_WITH_EMAIL_DOESN'T_EXIST"})
+
+        create_user(self.email)
+        response = self.forgot_password()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_another_email_is_sent_once_the_window_expired(self):
+        create_user(self.email)
+        window = settings.RESET_PASSWORD_COALESCE_WINDOW
+
+        with mock.patch("time.time", return_value=1_000_000.0) as clock:
+            self.forgot_password()
+            clock.return_value += window - 1
+            self.forgot_password()
+            self.assertEqual(len(mail.outbox), 1)
+
+            clock.return_value += 2
+            response = self.forgot_password()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_duplicate_of_a_pending_request_is_answered_with_200(self):
+        # The first request for an unknown address is still being handled.
+        caches["default"].add(
+            get_reset_request_cache_key(self.email, "http://localhost/"),
+            RESET_REQUEST_PENDING,
+        )
+
+        response = self.forgot_password()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+
+class CompiledSerializerValidatorTests(UserTestCase):
+    def assert_matches_the_serializer(self, validator, serializer_class, bodies):
+        for body in bodies:
+            with self.subTest(serializer=serializer_class.__name__, body=body):
+                # Only the fields, `validate()` is left to the views.
+                try:
+                    expected_data = dict(serializer_class().to_internal_value(body))
+                    expected_errors = {}
+                except serializers.ValidationError as exc:
+                    expected_data, expected_errors = {}, exc.detail
+
+                validated_data, errors = validator(body)
+
+                self.assertEqual(errors, expected_errors)
+                self.assertEqual(validated_data, expected_data)
+
+    def test_change_password(self):
+        self.assert_matches_the_serializer(
+            change_password_body_validator,
+            ChangePasswordBodyValidationSerializer,
+            (
+                {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+                {"oldPassword": "short", "newPassword": "password"},
+                {"oldPassword": "", "newPassword": None},
+                {},
+                ["not", "a", "mapping"],
+            ),
+        )
+
+    def test_register(self):
+        create_user("taken@example.com")
+        archived = create_user("archived@example.com")
+        list(archive_users(User.objects.filter(pk=archived.pk)))
+        body = {
+            "emailAddress": "new@example.com",
+            "firstName": "Zoë",
+            "lastName": "Example",
+            "password": PASSWORD,
+        }
+
+        self.assert_matches_the_serializer(
+            register_body_validator,
+            RegisterSerializer,
+            (
+                body,
+                {**body, "lastName": None},
+                {key: value for key, value in body.items() if key != "lastName"},
+                # Taken by a live user and by an archived one.
+                {**body, "emailAddress": "taken@example.com"},
+                {**body, "emailAddress": "archived@example.com"},
+                {**body, "emailAddress": "not an email", "firstName": "Z"},
+                {**body, "firstName": "  ", "password": "password"},
+                {**body, "firstName": ["not", "a", "string"], "password": 123456},
+                {},
+                "not a mapping",
+            ),
+        )
+
+    def test_reset_password(self):
+        self.assert_matches_the_serializer(
+            reset_password_body_validator,
+            ResetPasswordBodyValidationSerializer,
+            (
+                {"token": "some.signed.token", "password": PASSWORD},
+                {"token": "", "password": "short"},
+                {"token": None, "password": "password"},
+                {"password": PASSWORD},
+                {},
+                None,
+            ),
+        )
+
+    def test_token_bodies(self):
+        self.assert_matches_the_serializer(
+            token_obtain_body_validator,
+            TokenObtainPairWithUserSerializer,
+            (
+                {"emailAddress": "user@example.com", "password": PASSWORD},
+                {"emailAddress": "user@example.com", "password": ""},
+                {"emailAddress": None},
+                {},
+                [],
+            ),
+        )
+        self.assert_matches_the_serializer(
+            token_refresh_body_validator,
+            TokenRefreshWithUserSerializer,
+            (
+                {"refresh_token": "a.refresh.token"},
+                {"token": "a.deprecated.token"},
+                {"refresh_token": "", "token": None},
+                {},
+                42,
+            ),
+        )
+
+
+class FastJSONRendererTests(SimpleTestCase):
+    def payload(self, users=1):
+        return {
+            "results": [
+                {
+                    "id": i,
+                    "emailAddress": "user{i}@example.com".format(i=i),
+                    "firstName": "Zoë \u2028 <b>&</b>",
+                    "lastName": None,
+                    "is_active": True,
+                    "score": 2.5,
+                    "uuid": uuid.UUID(int=i),
+                    "last_seen": datetime.datetime(
+                        2024, 1, 2, 3, 4, 5, 678901, tzinfo=datetime.timezone.utc
+                    ),
+                    "birthday": datetime.date(2024, 1, 2),
+                    "session": datetime.timedelta(seconds=5),
+                }
+                for i in range(users)
+            ],
+            "count": users,
+        }
+
+    def test_renders_the_bytes_of_the_stock_renderer(self):
+        data = self.payload(users=3)
+
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_floats_only_differ_in_their_notation(self):
+        data = {"large": 1e16, "small": 1e-7}
+
+        fast = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(fast), json.loads(JSONRenderer().render(data)))
+        self.assertEqual(FastJSONRenderer().render(float("nan")), b"null")
+
+
+
+class FastJSONRendererResponseTests(UserTestCase):
+    def assert_renders_like_the_stock_renderer(self, response):
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_token_responses(self):
+        user = create_user("renderer@example.com")
+
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"emailAddress": user.emailAddress, "password": PASSWORD},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_renders_like_the_stock_renderer(response)
+
+        response = self.client.post(
+            reverse("token_refresh"),
+            {"refresh_token": response.json()["refresh_token"]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assert_renders_like_the_stock_renderer(response)
+
+    def test_error_responses(self):
+        # ErrorDetail in a ReturnDict, and in a plain dict for the 401.
+        for url, body in (
+            ("register_user", {"emailAddress": "not an email", "password": 1}),
+            ("token_obtain_pair", {"emailAddress": "nobody@example.com"}),
+            ("token_obtain_pair", {"emailAddress": "x@example.com", "password": "x"}),
+            ("token_refresh", {"refresh_token": "not a token"}),
+        ):
+            response = self.client.post(
+                reverse(url), body, content_type="application/json"
+            )
+            self.assertIn(response.status_code, (400, 401))
+            self.assert_renders_like_the_stock_renderer(response)
+
+
+class FastJSONParserTests(SimpleTestCase):
+    def test_parses_like_the_stock_parser(self):
+        for body in (
+            b'{"emailAddress": "user@example.com", "password": "Zo\u00eb \u2028"}',
+            b'{"a": 1, "a": 2.5, "b": [true, false, null], "c": {}}',
+            "\"Zoë\"".encode(),
+            # Integers that don't fit in 64 bits, orjson parses them as floats.
+            b'{"id": 123456789012345678901234567890}',
+            b"-9223372036854775809",
+            b"18446744073709551616",
+            # Rejected by orjson, accepted by the stock parser.
+            b'"\\ud800"',
+            b'{"name": "\\udfff tail"}',
+            b"1e400",
+        ):
+            with self.subTest(body=body):
+                self.assertEqual(
+                    repr(FastJSONParser().parse(io.BytesIO(body))),
+                    repr(JSONParser().parse(io.BytesIO(body))),
+                )
+
+    def test_errors_match_the_stock_parser(self):
+        for body in (b"{not json", b"", b"NaN", b"[1, 2,]", b'"\xed\xa0\x80"'):
+            with self.subTest(body=body):
+                with self.assertRaises(ParseError) as fast:
+                    FastJSONParser().parse(io.BytesIO(body))
+                with self.assertRaises(ParseError) as stock:
+                    JSONParser().parse(io.BytesIO(body))
+                self.assertEqual(str(fast.exception), str(stock.exception))
+
+
+class UserExportTests(UserTestCase):
+    def setUp(self):
+        self.admin = create_user("admin@example.com", is_admin=True)
+        self.users = [
+            create_user("export{i}@example.com".format(i=i), is_active=i != 1)
+            for i in range(3)
+        ]
+
+    def export(self, user=None, **params):
+        user = user or self.admin
+        return self.client.get(
+            reverse("export_users"),
+            params,
+            HTTP_AUTHORIZATION="Bearer " + str(AccessToken.for_user(user)),
+        )
+
+    def test_csv_with_all_the_fields(self):
+        response = self.export()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="users.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(io.StringIO(b"".join(response).decode())))
+        self.assertEqual(list(rows[0]), list(EXPORT_FIELDS))
+        self.assertNotIn("password", rows[0])
+        self.assertEqual(
+            sorted(row["emailAddress"] for row in rows),
+            sorted(user.emailAddress for user in self.users + [self.admin]),
+        )
+
+    def test_jsonl_with_selected_fields_and_filters(self):
+        response = self.export(
+            export_format="jsonl",
+            fields="emailAddress,is_active",
+            is_admin="false",
+            is_active="true",
+        )
+
+        self.assertEqual(response["Content-Type"], "application/jsonl")
+        rows = [json.loads(line) for line in b"".join(response).splitlines()]
+        self.assertEqual(
+            sorted(rows, key=lambda row: row["emailAddress"]),
+            [
+                {"emailAddress": "export0@example.com", "is_active": True},
+                {"emailAddress": "export2@example.com", "is_active": True},
+            ],
+        )
+
+    def test_gzip_stream(self):
+        plain = b"".join(self.export(export_format="jsonl"))
+        response = self.export(export_format="jsonl", gzip="true")
+
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertIn('filename="users.jsonl.gz"', response["Content-Disposition"])
+        self.assertEqual(gzip.decompress(b"".join(response)), plain)
+
+    def test_invalid_parameters(self):
+        for params in (
+            {"fields": "password"},
+            {"export_format": "xml"},
+            {"last_login__gte": "yesterday"},
+        ):
+            response = self.export(**params)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(
+                response.json()["error"], "ERROR_INVALID_EXPORT_PARAMETERS"
+            )
+
+    def test_only_admins_can_export(self):
+        self.assertEqual(self.export(self.users[0]).status_code, 403)
+        self.assertEqual(self.client.get(reverse("export_users")).status_code, 401)
+
+    def test_command_writes_to_stdout(self):
+        stdout = io.TextIOWrapper(io.BytesIO())
+
+        call_command(
+            "export_users",
+            "--format=jsonl",
+            "--fields=emailAddress",
+            "--filter=emailAddress__istartswith=export",
+            "--gzip",
+            stdout=stdout,
+        )
+
+        lines = gzip.decompress(stdout.buffer.getvalue()).splitlines()
+        self.assertEqual(
+            sorted(json.loads(line)["emailAddress"] for line in lines),
+            [user.emailAddress for user in self.users],
+        )
+
+    def test_command_writes_to_a_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "users.csv")
+
+        call_command("export_users", "--fields=id,emailAddress", "--output", path)
+
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), len(self.users) + 1)
+        self.assertEqual(list(rows[0]), ["id", "emailAddress"])
+
+    def test_command_rejects_invalid_arguments(self):
+        with self.assertRaises(CommandError):
+            call_command("export_users", "--filter=password=x", stdout=io.StringIO())
+        with self.assertRaises(CommandError):
+            call_command("export_users", "--fields=password", stdout=io.StringIO())
+
+
+class ShardedUserExportTests(ShardedTestCase):
+    def test_export_reads_every_shard(self):
+        users = [
+            create_user(email_on_shard(shard, "export")) for shard in get_user_shards()
+        ]
+        stdout = io.TextIOWrapper(io.BytesIO())
+
+        call_command("export_users", "--format=jsonl", "--fields=id", stdout=stdout)
+
+        lines = stdout.buffer.getvalue().splitlines()
+        self.assertEqual(
+            [json.loads(line)["id"] for line in lines], [user.pk for user in users]
+        )
+
+
+class AdminBulkActionTests(UserTestCase):
+    def setUp(self):
+        self.admin = create_user("admin@example.com", is_admin=True)
+        self.client.force_login(self.admin)
+        self.users = [
+            create_user("bulk{i}@example.com".format(i=i)) for i in range(3)
+        ]
+
+    def run_action(self, action, users):
+        changed = mock.Mock()
+        users_auth_changed.connect(changed)
+        self.addCleanup(users_auth_changed.disconnect, changed)
+
+        with self.assertLogs("base.audit", "INFO") as logs:
+            response = self.client.post(
+                reverse("admin:base_baseuser_changelist"),
+                {
+                    "action": action,
+                    "index": "0",
+                    "_selected_action": [user.pk for user in users],
+                },
+            )
+        self.assertEqual(response.status_code, 302)
+
+        changed_ids = [
+            user_id
+            for call in changed.call_args_list
+            for user_id in call.kwargs["user_ids"]
+        ]
+        return logs.output, sorted(changed_ids)
+
+    def test_grant_admin(self):
+        logs, changed_ids = self.run_action("grant_admin", self.users[:2])
+
+        for user in self.users:
+            user.refresh_from_db()
+        self.assertEqual([user.is_admin for user in self.users], [True, True, False])
+        self.assertEqual(changed_ids, sorted(user.pk for user in self.users[:2]))
+        self.assertIn(
+            "Admin action grant_admin by admin@example.com updated 2 users.", logs[0]
+        )
+
+    def test_revoke_admin_spares_the_requester(self):
+        other_admin = create_user("other-admin@example.com", is_admin=True)
+
+        logs, changed_ids = self.run_action("revoke_admin", [self.admin, other_admin])
+
+        self.admin.refresh_from_db()
+        other_admin.refresh_from_db()
+        self.assertTrue(self.admin.is_admin)
+        self.assertFalse(other_admin.is_admin)
+        self.assertEqual(changed_ids, [other_admin.pk])
+        self.assertIn("updated 1 users.", logs[0])
+
+    def test_deactivate_spares_the_requester(self):
+        logs, changed_ids = self.run_action(
+            "deactivate_users", [self.admin] + self.users
+        )
+
+        self.admin.refresh_from_db()
+        self.assertTrue(self.admin.is_active)
+        self.assertEqual(changed_ids, sorted(user.pk for user in self.users))
+
+    def test_force_logout_revokes_the_existing_tokens(self):
+        user = self.users[0]
+        token = AccessToken.for_user(user)
+        token["iat"] -= 1
+        access = str(token)
+
+        logs, changed_ids = self.run_action("force_logout", [user])
+
+        user.refresh_from_db()
+        self.assertIsNotNone(user.tokens_valid_after)
+        self.assertEqual(changed_ids, [user.pk])
+        response = self.client.post(
+            reverse("change_user_password"),
+            {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+            content_type="application/json",
+            HTTP_AUTHORIZATION="Bearer " + access,
+        )
+        self.assertEqual(response.status_code, 401)
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import is_token_revoked
+
+User = get_user_model()
+
+
+class RefreshToken(tokens.RefreshToken):
+    """
+    A refresh token that can't be used anymore once the user has been
+    force-logged out.
+    """
+
+    def verify(self):
+        super().verify()
+
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            return
+
+        tokens_valid_after = (
+            User.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values_list("tokens_valid_after", flat=True)
+            .first()
+        )
+        if is_token_revoked(tokens_valid_after, self):
+            raise TokenError(_("Token has been revoked"))
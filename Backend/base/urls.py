@@ -22,4 +22,8 @@ urlpatterns = [
         views.ResetPasswordView.as_view(),
         name="reset_password",
     ),
+    path("api/auth/verify", views.verify_token, name="verify_token"),
+    path("healthz", views.healthz, name="healthz"),
+    path("readyz", views.readyz, name="readyz"),
+    path("api/users/export", views.UserExportView.as_view(), name="export_users"),
 ]
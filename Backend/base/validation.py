@@ -0,0 +1,121 @@
+from collections.abc import Mapping
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework import serializers
+from rest_framework.exceptions import ErrorDetail, ValidationError
+from rest_framework.fields import SkipField, empty, get_error_detail
+from rest_framework.settings import api_settings
+
+
+class CompiledSerializerValidator:
+    """
+    Validates request bodies against a flat serializer made of `CharField`s
+    (`EmailField`, `URLField`, ...) without instantiating the serializer and
+    deep-copying its fields on every request.
+
+    The serializer is instantiated once, its bound fields are kept around and
+    checked in the same order and with the same rules as `serializer.is_valid()`.
+    The errors have the same structure, messages and codes as
+    `serializer.errors`. The serializer-level `validate()` is not run, it is up
+    to the caller.
+    """
+
+    def __init__(self, serializer_class):
+        prototype = serializer_class()
+        self.serializer_class = serializer_class
+        self.invalid_message = prototype.error_messages["invalid"]
+        self.fields = []
+
+        for name, field in prototype.fields.items():
+            if field.read_only:
+                continue
+            if not isinstance(field, serializers.CharField) or field.source != name:
+                raise ImproperlyConfigured(
+                    "Field '{name}' of {serializer} can't be compiled, only "
+                    "CharFields without a custom source are supported.".format(
+                        name=name, serializer=serializer_class.__name__
+                    )
+                )
+            self.fields.append(
+                (
+                    name,
+                    field,
+                    tuple(field.validators),
+                    getattr(prototype, "validate_" + name, None),
+                )
+            )
+
+    def __call__(self, data):
+        """
+        Validates the provided request data.
+
+        :return: The validated data and the errors, only one of them is filled.
+        :rtype: tuple(dict, dict)
+        """
+
+        if not isinstance(data, Mapping):
+            message = self.invalid_message.format(datatype=type(data).__name__)
+            return {}, {
+                api_settings.NON_FIELD_ERRORS_KEY: [
+                    ErrorDetail(message, code="invalid")
+                ]
+            }
+
+        validated_data = {}
+        errors = {}
+
+        for name, field, validators, validate_method in self.fields:
+            try:
+                value = self._run_field(field, validators, field.get_value(data))
+                if validate_method is not None:
+                    value = validate_method(value)
+            except SkipField:
+                continue
+            except ValidationError as exc:
+                errors[name] = exc.detail
+            except DjangoValidationError as exc:
+                errors[name] = get_error_detail(exc)
+            else:
+                validated_data[name] = value
+
+        if errors:
+            return {}, errors
+        return validated_data, {}
+
+    @staticmethod
+    def _run_field(field, validators, data):
+        # Same steps as `CharField.run_validation`, without going through
+        # `validate_empty_values` and `run_validators` on every call.
+        if data == "" or (field.trim_whitespace and str(data).strip() == ""):
+            if not field.allow_blank:
+                field.fail("blank")
+            return ""
+
+        if data is empty:
+            if field.required:
+                field.fail("required")
+            return field.get_default()
+
+        if data is None:
+            if not field.allow_null:
+                field.fail("null")
+            return None
+
+        value = field.to_internal_value(data)
+
+        errors = []
+        for validator in validators:
+            try:
+                if getattr(validator, "requires_context", False):
+                    validator(value, field)
+                else:
+                    validator(value)
+            except ValidationError as exc:
+                errors.extend(exc.detail)
+            except DjangoValidationError as exc:
+                errors.extend(get_error_detail(exc))
+        if errors:
+            raise ValidationError(errors)
+
+        return value
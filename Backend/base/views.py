@@ -1,17 +1,40 @@
+import hashlib
 from urllib.parse import urljoin
 
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from drf_spectacular.utils import OpenApiParameter, extend_schema
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
 from itsdangerous import URLSafeTimedSerializer
 
+from .audit import audit_log
 from .email import send_email
+from .forward_auth import verify_request
+from .idempotency import IdempotentViewMixin
+from .models import AuthEvent
+from .sharding import normalize_email
+from .warmup import check_databases, is_ready
+from .exports import (
+    EXPORT_FIELDS,
+    EXPORT_FILTERS,
+    EXPORT_FORMATS,
+    ExportError,
+    iter_export,
+    parse_export_fields,
+    parse_export_filters,
+)
 from rest_framework_simplejwt.views import (
     TokenObtainPairView,
     TokenRefreshView,
@@ -30,14 +53,23 @@ from .serializers import (
     ChangePasswordBodyValidationSerializer,
     SendResetPasswordEmailBodyValidationSerializer,
     ResetPasswordBodyValidationSerializer,
+    register_body_validator,
+    change_password_body_validator,
+    reset_password_body_validator,
+    token_obtain_body_validator,
+    token_refresh_body_validator,
 )
 
 User = get_user_model()
 
 
-class UserRegisterView(APIView):
+class UserRegisterView(IdempotentViewMixin, APIView):
     permission_classes = (AllowAny,)
 
+    def get_idempotency_key_ttl(self):
+        # The response holds the tokens of the new user.
+        return settings.IDEMPOTENCY_TOKEN_RESPONSE_TTL
+
     @extend_schema(
         tags=["User"],
         request=RegisterSerializer,
@@ -57,10 +89,8 @@ class UserRegisterView(APIView):
         },
     )
     def post(self, request):
-        data = RegisterSerializer(data=request.data)
-        if data.is_valid():
-            details = data.data
-
+        details, errors = register_body_validator(request.data)
+        if not errors:
             user = User.objects.create(
                 emailAddress=details["emailAddress"], firstName=details["firstName"]
             )
@@ -68,6 +98,7 @@ class UserRegisterView(APIView):
                 user.lastName = details["lastName"]
 
             user.set_password(details["password"])
+            audit_log.record(AuthEvent.Event.REGISTER, user, request=request)
 
             refresh = RefreshToken.for_user(user)
             user_response = {
@@ -80,16 +111,42 @@ class UserRegisterView(APIView):
             }
             return Response(user_response, status.HTTP_201_CREATED)
 
-        return Response(data.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class ObtainJSONWebToken(TokenObtainPairView):
+class CompiledBodyTokenViewMixin:
+    """
+    Validates the request body of a token view with a precompiled validator
+    instead of instantiating the serializer with the data. The serializer is
+    only used to run its `validate` method.
+    """
+
+    body_validator = None
+
+    def post(self, request, *args, **kwargs):
+        attrs, errors = self.body_validator(request.data)
+        if errors:
+            raise ValidationError(errors)
+
+        serializer = self.get_serializer()
+        try:
+            data = serializer.validate(attrs)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        except (ValidationError, DjangoValidationError) as exc:
+            raise ValidationError(detail=as_serializer_error(exc))
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ObtainJSONWebToken(CompiledBodyTokenViewMixin, TokenObtainPairView):
     """
     A slightly modified version of the ObtainJSONWebToken that uses an email as
     username.
     """
 
     serializer_class = TokenObtainPairWithUserSerializer
+    body_validator = token_obtain_body_validator
 
     @extend_schema(
         tags=["User"],
@@ -111,8 +168,9 @@ class ObtainJSONWebToken(TokenObtainPairView):
         return super().post(*args, **kwargs)
 
 
-class RefreshJSONWebToken(TokenRefreshView):
+class RefreshJSONWebToken(CompiledBodyTokenViewMixin, TokenRefreshView):
     serializer_class = TokenRefreshWithUserSerializer
+    body_validator = token_refresh_body_validator
 
     @extend_schema(
         tags=["User"],
@@ -153,16 +211,15 @@ class ChangePasswordView(APIView):
         },
     )
     def post(self, request):
-        data = ChangePasswordBodyValidationSerializer(data=request.data)
-
-        if data.is_valid():
-            post_data = data.data
+        post_data, errors = change_password_body_validator(request.data)
 
+        if not errors:
             user = User.objects.get(id=request.user.id)
 
             if user.check_password(post_data["oldPassword"]):
                 user.set_password(post_data["newPassword"])
                 user.save()
+                audit_log.record(AuthEvent.Event.PASSWORD_CHANGE, user, request=request)
                 return Response("", status.HTTP_204_NO_CONTENT)
 
             else:
@@ -170,10 +227,10 @@ class ChangePasswordView(APIView):
                     {"error": "ERROR_INVALID_OLD_PASSWORD"}, status.HTTP_400_BAD_REQUEST
                 )
 
-        return Response(data.errors, status.HTTP_400_BAD_REQUEST)
+        return Response(errors, status.HTTP_400_BAD_REQUEST)
 
 
-class SendResetPasswordView(APIView):
+class SendResetPasswordView(IdempotentViewMixin, APIView):
     permission_classes = (AllowAny,)
 
     @extend_schema(
@@ -184,8 +241,12 @@ class SendResetPasswordView(APIView):
             "Sends an email containing the password reset link to the email address "
             "of the user. This will only be done if a user is found with the given "
             "email address. The endpoint will not fail if the email address is not "
-            "found. The link is going to the valid for {valid} hours.".format(
-                valid=int(settings.RESET_PASSWORD_TOKEN_MAX_AGE)
+            "found. The link is going to the valid for {valid} hours. Repeated "
+            "requests for the same address and link within {window} seconds get "
+            "the response of the first one, and a 200 while the first one is "
+            "still being handled, whatever its outcome.".format(
+                valid=int(settings.RESET_PASSWORD_TOKEN_MAX_AGE),
+                window=settings.RESET_PASSWORD_COALESCE_WINDOW,
             )
         ),
         responses={
@@ -201,33 +262,70 @@ class SendResetPasswordView(APIView):
 
         if data.is_valid():
             post_data = data.data
+
+            # Repeated requests for the same address and link within the window
+            # reuse the outcome of the first one, without touching the database
+            # or SMTP.
+            cache_key = get_reset_request_cache_key(
+                post_data["emailAddress"], post_data["base_url"]
+            )
+            window = settings.RESET_PASSWORD_COALESCE_WINDOW
+            if not cache.add(cache_key, RESET_REQUEST_PENDING, timeout=window):
+                outcome = cache.get(cache_key, RESET_REQUEST_PENDING)
+                if outcome == RESET_REQUEST_PENDING:
+                    # The outcome of the first request isn't known yet, waiting
+                    # for it would hold a worker. The duplicate is answered as
+                    # if it succeeded, even if the first one ends with a 400.
+                    return Response("", status.HTTP_200_OK)
+                return Response(*outcome)
+
             try:
-                user = User.objects.get(emailAddress=post_data["emailAddress"])
-                base_url = post_data["base_url"]
-                if not base_url.endswith("/"):
-                    base_url += "/"
+                response = self.send_reset_email(request, post_data)
+            except Exception:
+                cache.delete(cache_key)
+                raise
 
-                signer = get_reset_password_signer()
-                signed_user_id = signer.dumps(user.id)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(cache_key, (response.data, response.status_code), window)
+            else:
+                # An unknown address may be registered right after, the error
+                # isn't kept.
+                cache.delete(cache_key)
+            return response
 
-                reset_url = urljoin(base_url, signed_user_id)
+        return Response(data.errors, status.HTTP_400_BAD_REQUEST)
 
-                send_email(
-                    post_data["emailAddress"],
-                    "Reset Password",
-                    "emails/send_forgotpassword_token.html",
-                    {"name": user.firstName, "link": reset_url},
-                )
+    @staticmethod
+    def send_reset_email(request, post_data):
+        try:
+            # Restores the account if it was archived.
+            user = User.objects.get_by_natural_key(post_data["emailAddress"])
+            base_url = post_data["base_url"]
+            if not base_url.endswith("/"):
+                base_url += "/"
 
-                return Response("", status.HTTP_200_OK)
+            signer = get_reset_password_signer()
+            signed_user_id = signer.dumps(user.id)
 
-            except User.DoesNotExist:
-                return Response(
-                    {"error": "USER_WITH_EMAIL_DOESN'T_EXIST"},
-                    status.HTTP_400_BAD_REQUEST,
-                )
+            reset_url = urljoin(base_url, signed_user_id)
 
-        return Response(data.errors, status.HTTP_400_BAD_REQUEST)
+            send_email(
+                post_data["emailAddress"],
+                "Reset Password",
+                "emails/send_forgotpassword_token.html",
+                {"name": user.firstName, "link": reset_url},
+            )
+            audit_log.record(
+                AuthEvent.Event.PASSWORD_RESET_REQUEST, user, request=request
+            )
+
+            return Response("", status.HTTP_200_OK)
+
+        except User.DoesNotExist:
+            return Response(
+                {"error": "USER_WITH_EMAIL_DOESN'T_EXIST"},
+                status.HTTP_400_BAD_REQUEST,
+            )
 
 
 class ResetPasswordView(APIView):
@@ -258,9 +356,8 @@ class ResetPasswordView(APIView):
         auth=[],
     )
     def post(self, request):
-        data = ResetPasswordBodyValidationSerializer(data=request.data)
-        if data.is_valid():
-            post_data = data.data
+        post_data, errors = reset_password_body_validator(request.data)
+        if not errors:
             signer = get_reset_password_signer()
             user_id = signer.loads(
                 post_data["token"], max_age=settings.RESET_PASSWORD_TOKEN_MAX_AGE
@@ -271,6 +368,7 @@ class ResetPasswordView(APIView):
 
                 user.set_password(post_data["password"])
                 user.save()
+                audit_log.record(AuthEvent.Event.PASSWORD_RESET, user, request=request)
                 return Response("", status.HTTP_200_OK)
 
             except User.DoesNotExist:
@@ -279,7 +377,76 @@ class ResetPasswordView(APIView):
                     status.HTTP_400_BAD_REQUEST,
                 )
 
-        return Response(data.errors, status.HTTP_400_BAD_REQUEST)
+        return Response(errors, status.HTTP_400_BAD_REQUEST)
+
+
+class UserExportView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    @extend_schema(
+        tags=["User"],
+        operation_id="export_users",
+        description=(
+            "Streams all the users matching the filters as CSV or JSON lines. Only "
+            "available to admins."
+        ),
+        parameters=[
+            OpenApiParameter("export_format", enum=EXPORT_FORMATS, default="csv"),
+            OpenApiParameter(
+                "fields",
+                description="Comma separated list of fields, out of: {fields}.".format(
+                    fields=", ".join(EXPORT_FIELDS)
+                ),
+            ),
+            OpenApiParameter("gzip", bool, default=False),
+            *[OpenApiParameter(name) for name in EXPORT_FILTERS],
+        ],
+        responses={
+            (200, "text/csv"): str,
+            (200, "application/jsonl"): str,
+            400: get_error_schema(["ERROR_INVALID_EXPORT_PARAMETERS"]),
+        },
+    )
+    def get(self, request):
+        params = request.query_params
+        # `format` is already used by DRF to pick the renderer.
+        export_format = params.get("export_format", "csv")
+        compress = params.get("gzip", "").lower() in ("1", "true")
+
+        try:
+            rows = iter_export(
+                parse_export_fields(params.get("fields")),
+                parse_export_filters(params),
+                export_format,
+                compress=compress,
+            )
+        except ExportError as e:
+            return Response(
+                {"error": "ERROR_INVALID_EXPORT_PARAMETERS", "detail": str(e)},
+                status.HTTP_400_BAD_REQUEST,
+            )
+
+        filename = "users.{extension}".format(extension=export_format)
+        content_type = "text/csv" if export_format == "csv" else "application/jsonl"
+        if compress:
+            filename += ".gz"
+            content_type = "application/gzip"
+
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response["Content-Disposition"] = 'attachment; filename="{filename}"'.format(
+            filename=filename
+        )
+        return response
+
+
+RESET_REQUEST_PENDING = "pending"
+
+
+def get_reset_request_cache_key(email, base_url):
+    digest = hashlib.sha256(
+        "\n".join((normalize_email(email), base_url)).encode()
+    ).hexdigest()
+    return "reset-password-request:" + digest
 
 
 def get_reset_password_signer():
@@ -291,3 +458,48 @@ def get_reset_password_signer():
     """
 
     return URLSafeTimedSerializer(settings.SECRET_KEY, "user-reset-password")
+
+
+@csrf_exempt
+def verify_token(request):
+    """
+    Forward-auth endpoint for the `auth_request` of nginx or the `ext_authz` of
+    Envoy. It's a plain Django view rather than an APIView to keep the cost of a
+    subrequest down. The proxies keep the method of the original request, so
+    any method is accepted, and the body is never read.
+
+    :return: An empty 200 response with the `X-User-Id` and `X-User-Email`
+        headers if the bearer token is valid, an empty 401 response otherwise.
+    """
+
+    identity = verify_request(request)
+    if identity is None:
+        response = HttpResponse(status=401)
+        response["WWW-Authenticate"] = 'Bearer realm="api"'
+        return response
+
+    response = HttpResponse()
+    response["X-User-Id"], response["X-User-Email"] = identity
+    response["Cache-Control"] = "no-store"
+    return response
+
+
+def healthz(request):
+    """
+    Liveness probe, doesn't touch the database.
+    """
+
+    return JsonResponse({"status": "ok"})
+
+
+def readyz(request):
+    """
+    Readiness probe, only reports ready once the worker is warmed up and while
+    the databases answer.
+    """
+
+    if not is_ready():
+        return JsonResponse({"status": "warming_up"}, status=503)
+    if not check_databases():
+        return JsonResponse({"status": "database_unavailable"}, status=503)
+    return JsonResponse({"status": "ready"})
@@ -0,0 +1,106 @@
+import logging
+import os
+import threading
+
+from django.contrib.auth.hashers import make_password
+from django.db import DatabaseError, connections
+from django.template.loader import render_to_string
+from django.urls import reverse
+from rest_framework_simplejwt.state import token_backend
+
+from .password_validation import BreachedPasswordValidator
+from .sharding import get_user_shards
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_started_in = None
+_ready = threading.Event()
+
+
+def warm_templates():
+    render_to_string(
+        "emails/send_forgotpassword_token.html", {"name": "", "link": ""}
+    )
+
+
+def warm_password_hashing():
+    make_password("warm-up")
+    BreachedPasswordValidator().is_breached("warm-up")
+
+
+def warm_tokens():
+    token_backend.decode(token_backend.encode({"warm_up": True}))
+
+
+def warm_urls():
+    reverse("register_user")
+
+
+WARM_UP_STEPS = (
+    warm_templates,
+    warm_password_hashing,
+    warm_tokens,
+    warm_urls,
+)
+
+
+def check_databases():
+    """
+    Runs a `SELECT 1` on every database from the calling thread. The
+    connections are per thread, so they are left open for the request thread
+    to reuse them, within `CONN_MAX_AGE`.
+
+    :return: Whether all the databases answered.
+    :rtype: bool
+    """
+
+    for alias in {"default", *get_user_shards()}:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1")
+        except DatabaseError:
+            logger.exception("Database %s is unavailable.", alias)
+            return False
+
+    return True
+
+
+def warm_up():
+    """
+    Runs the code paths that are otherwise slow on the first requests of a
+    worker: template compilation, the first PBKDF2 hash and the simplejwt
+    backend setup. A failing step is logged and doesn't prevent the worker from
+    becoming ready. The database connections belong to the request threads,
+    they are checked by `check_databases` on every readiness probe instead.
+    """
+
+    for step in WARM_UP_STEPS:
+        try:
+            step()
+        except Exception:
+            logger.exception("Warm-up step %s failed.", step.__name__)
+
+    _ready.set()
+
+
+def start_warm_up():
+    """
+    Starts the warm-up in a background thread, once per process. Forked workers
+    don't inherit the thread of their parent, so they start their own.
+    """
+
+    global _started_in
+
+    with _lock:
+        if _started_in == os.getpid():
+            return
+        _started_in = os.getpid()
+        _ready.clear()
+
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def is_ready():
+    start_warm_up()
+    return _ready.is_set()
@@ -0,0 +1,79 @@
+"""
+Benchmarks, kept out of the test suite so that it doesn't depend on timings.
+Each module runs against throwaway test databases, from the Backend directory:
+
+    python -m benchmarks.forward_auth
+
+The settings default to `backend.test_settings`, the environment variables of
+the project (SECRET_KEY, ...) must be set.
+"""
+
+import contextlib
+import logging
+import os
+import time
+
+
+def setup():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.test_settings")
+
+    import django
+
+    django.setup()
+    # Every rejected request would be logged as a warning.
+    logging.getLogger("django.request").setLevel(logging.ERROR)
+
+
+@contextlib.contextmanager
+def test_databases():
+    """
+    Creates the test databases for the duration of the block, like the test
+    runner does.
+    """
+
+    from django.test.utils import (
+        setup_databases,
+        setup_test_environment,
+        teardown_databases,
+        teardown_test_environment,
+    )
+
+    from base.activity import activity_buffer
+    from base.audit import audit_log
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        # Nothing must be flushed to the real databases at exit.
+        audit_log.disable()
+        activity_buffer.disable()
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(function, calls, repeat=5):
+    """
+    :return: The best time of `repeat` runs of `calls` calls, in seconds.
+    :rtype: float
+    """
+
+    function()
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def report(name, calls, seconds, baseline=None):
+    line = "{name:<48} {rate:>10,.0f}/s {unit:>9.1f}us".format(
+        name=name, rate=calls / seconds, unit=seconds / calls * 1e6
+    )
+    if baseline is not None:
+        line += "  x{speedup:.1f}".format(speedup=baseline / seconds)
+    print(line)
@@ -0,0 +1,60 @@
+"""
+Rendering of the responses and parsing of the request bodies of the API, with
+the orjson renderer and parser against the stock ones of DRF:
+
+    python -m benchmarks.json_bodies
+"""
+
+import io
+
+from . import measure, report, setup
+
+CALLS = 2000
+
+
+def main():
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from base.parsers import FastJSONParser
+    from base.renderers import FastJSONRenderer
+
+    # The shape of the responses of the API: users and tokens.
+    response = {
+        "results": [
+            {
+                "id": i,
+                "emailAddress": "user{i}@example.com".format(i=i),
+                "firstName": "Zoë",
+                "lastName": None,
+                "is_staff": False,
+            }
+            for i in range(100)
+        ],
+        "access_token": "x" * 200,
+        "refresh_token": "y" * 200,
+    }
+
+    for name, data in (("user list", response), ("one user", response["results"][0])):
+        stock = measure(lambda: JSONRenderer().render(data), CALLS)
+        report("render {name}, stock".format(name=name), CALLS, stock)
+        fast = measure(lambda: FastJSONRenderer().render(data), CALLS)
+        report("render {name}, orjson".format(name=name), CALLS, fast, stock)
+
+    register = JSONRenderer().render(
+        {
+            "emailAddress": "user@example.com",
+            "password": "Zq9!long-unique-pass",
+            "firstName": "Zoë",
+            "lastName": "Example",
+        }
+    )
+    stock = measure(lambda: JSONParser().parse(io.BytesIO(register)), CALLS)
+    report("parse register body, stock", CALLS, stock)
+    fast = measure(lambda: FastJSONParser().parse(io.BytesIO(register)), CALLS)
+    report("parse register body, orjson", CALLS, fast, stock)
+
+
+if __name__ == "__main__":
+    setup()
+    main()
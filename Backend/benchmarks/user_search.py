@@ -0,0 +1,61 @@
+"""
+Search of the user changelist on a large user table, with the search indexes
+against a table scan, on the SQL statements alone:
+
+    python -m benchmarks.user_search
+"""
+
+from . import measure, report, setup, test_databases
+
+SEEDED_USERS = 20000
+QUERIES = 20
+
+
+def main():
+    from django.contrib import admin
+    from django.contrib.auth import get_user_model
+    from django.db import connections
+    from django.test import RequestFactory
+
+    from base.admin import UserAdmin
+
+    User = get_user_model()
+
+    users = User.objects.using("default")
+    users.bulk_create(
+        User(
+            emailAddress="member{i:05d}@example.com".format(i=i),
+            firstName="First{i:05d}".format(i=i),
+            lastName="Last{i:05d}".format(i=i),
+        )
+        for i in range(SEEDED_USERS)
+    )
+    with connections["default"].cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+    def statement(queryset):
+        # The raw statement, the ORM overhead would hide the difference.
+        sql, params = queryset.query.sql_with_params()
+
+        def execute():
+            with connections["default"].cursor() as cursor:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+
+        return execute
+
+    search, _ = UserAdmin(User, admin.site).get_search_results(
+        RequestFactory().get("/"), users, "first12345"
+    )
+    scan = users.filter(firstName__icontains="t12345")
+
+    scanned = measure(statement(scan), QUERIES)
+    report("substring search, table scan", QUERIES, scanned)
+    searched = measure(statement(search.order_by("emailAddress")), QUERIES)
+    report("changelist search, search indexes", QUERIES, searched, scanned)
+
+
+if __name__ == "__main__":
+    setup()
+    with test_databases():
+        main()
@@ -0,0 +1,45 @@
+"""
+Validation of the request bodies with the precompiled validators against
+instantiating the serializers with the data:
+
+    python -m benchmarks.validators
+"""
+
+from . import measure, report, setup
+
+CALLS = 2000
+PASSWORD = "Zq9!long-unique-pass"
+
+
+def main():
+    from base import serializers
+
+    for name, serializer_class, validator, body in (
+        (
+            "change password",
+            serializers.ChangePasswordBodyValidationSerializer,
+            serializers.change_password_body_validator,
+            {"oldPassword": PASSWORD, "newPassword": "An0ther-long-pass!"},
+        ),
+        (
+            "reset password",
+            serializers.ResetPasswordBodyValidationSerializer,
+            serializers.reset_password_body_validator,
+            {"token": "some.signed.token", "password": PASSWORD},
+        ),
+        (
+            "token refresh",
+            serializers.TokenRefreshWithUserSerializer,
+            serializers.token_refresh_body_validator,
+            {"refresh_token": "a.refresh.token"},
+        ),
+    ):
+        stock = measure(lambda: serializer_class().to_internal_value(body), CALLS)
+        report("{name}, serializer".format(name=name), CALLS, stock)
+        compiled = measure(lambda: validator(body), CALLS)
+        report("{name}, compiled".format(name=name), CALLS, compiled, stock)
+
+
+if __name__ == "__main__":
+    setup()
+    main()